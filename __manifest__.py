@@ -37,11 +37,13 @@ Comprehensive solution for medical and dental clinics featuring:
         'data/clinic_data.xml',
         'data/dental_data.xml',
         'data/service_data.xml',
+        'data/mail_template_data.xml',
         
         # Views
         'views/menu_views.xml',
         'views/patient_views.xml',
         'views/appointment_views.xml',
+        'views/appointment_series_views.xml',
         'views/treatment_views.xml',
         'views/dental_views.xml',
         'views/insurance_views.xml',
@@ -50,9 +52,13 @@ Comprehensive solution for medical and dental clinics featuring:
         # Reports
         'report/treatment_report.xml',
         'report/invoice_report.xml',
+        'report/clinic_report_views.xml',
+        'report/doctor_capacity_views.xml',
+        'report/perf_log_views.xml',
         
         # Wizards
         'wizard/appointment_wizard_views.xml',
+        'wizard/patient_import_wizard_views.xml',
     ],
     'demo': [
         'data/demo_data.xml',
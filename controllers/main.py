@@ -0,0 +1,50 @@
+import tempfile
+
+from werkzeug.wsgi import wrap_file
+
+from odoo import http
+from odoo.exceptions import UserError
+from odoo.http import request, content_disposition
+
+class MedicalClinicController(http.Controller):
+    
+    @http.route('/medical_clinic/available_slots', type='json', auth='user')
+    def available_slots(self, doctor_ids, date_from, date_to, service_ids=None, duration=None):
+        return request.env['clinic.appointment'].get_available_slots(
+            doctor_ids, date_from, date_to, service_ids=service_ids, duration=duration)
+    
+    @http.route('/medical_clinic/export/fhir', type='http', auth='user')
+    def export_fhir(self, ids=None, batch_size=1000):
+        Patient = request.env['clinic.patient']
+        patients = Patient.browse([int(id_) for id_ in ids.split(',')]) if ids else Patient.search([])
+        # The export is spooled to a temporary file and streamed back from it,
+        # so neither side holds the whole practice in memory
+        export_file = tempfile.TemporaryFile()
+        patients.export_fhir_ndjson(export_file, batch_size=int(batch_size))
+        size = export_file.tell()
+        export_file.seek(0)
+        response = request.make_response(wrap_file(request.httprequest.environ, export_file), headers=[
+            ('Content-Type', 'application/fhir+ndjson'),
+            ('Content-Length', size),
+            ('Content-Disposition', content_disposition('patients.ndjson')),
+        ])
+        response.direct_passthrough = True
+        return response
+    
+    @http.route('/medical_clinic/report/batch', type='http', auth='user')
+    def report_batch(self, report_ref, ids, output='pdf'):
+        # Only treatment reports can be printed here, on treatments the user can read
+        try:
+            report = request.env['clinic.treatment']._get_batch_report(report_ref)
+        except UserError:
+            raise request.not_found()
+        if output not in ('pdf', 'zip'):
+            raise request.not_found()
+        treatments = request.env[report.model].browse([int(id_) for id_ in ids.split(',')])
+        treatments.check_access('read')
+        filename, mimetype, content = treatments._get_report_batch_file(report_ref, output=output)
+        return request.make_response(content, headers=[
+            ('Content-Type', mimetype),
+            ('Content-Length', len(content)),
+            ('Content-Disposition', content_disposition(filename)),
+        ])
@@ -2,9 +2,15 @@ from . import product
 from . import res_partner
 from . import hr_employee
 from . import patient
+from . import fhir_export
 from . import service
 from . import appointment
+from . import appointment_series
 from . import treatment
 from . import insurance
 from . import dental
 from . import account_move
+from . import dashboard
+from . import doctor_capacity
+from . import benchmark
+from . import perf_log
@@ -1,7 +1,27 @@
+import logging
+import threading
+import time
+
 from odoo import models, fields, api, _
-from odoo.exceptions import ValidationError
+from odoo.exceptions import UserError, ValidationError
+from odoo.tools import SQL, split_every
+from odoo.tools.sql import create_index
+from collections import defaultdict
 from datetime import datetime, timedelta
 
+from .perf_log import track_performance
+
+_logger = logging.getLogger(__name__)
+
+# States that do not block the doctor's agenda
+INACTIVE_STATES = ('cancelled', 'no_show')
+# Fields mirrored on the doctor's calendar event
+CALENDAR_SYNC_FIELDS = ('date', 'duration', 'doctor_id', 'patient_id', 'state')
+# Closed appointments archived once past the archive horizon
+ARCHIVE_STATES = ('done', 'cancelled', 'no_show')
+# Fields feeding the cached doctor capacity
+CAPACITY_FIELDS = ('date', 'duration', 'doctor_id', 'state')
+
 class ClinicAppointment(models.Model):
     _name = 'clinic.appointment'
     _description = 'Medical Appointment'
@@ -12,13 +32,13 @@ class ClinicAppointment(models.Model):
     appointment_code = fields.Char(string='Appointment #', required=True, copy=False,
                                   default='New', readonly=True)
     patient_id = fields.Many2one('clinic.patient', string='Patient', required=True,
-                                tracking=True, ondelete='restrict')
+                                tracking=True, ondelete='restrict', index=True)
     doctor_id = fields.Many2one('hr.employee', string='Doctor/Dentist', required=True,
                                domain=[('is_medical_professional', '=', True)],
                                tracking=True)
     
     # Appointment Details
-    date = fields.Datetime(string='Date & Time', required=True, tracking=True)
+    date = fields.Datetime(string='Date & Time', required=True, tracking=True, index=True)
     duration = fields.Float(string='Duration (hours)', default=0.5)
     end_date = fields.Datetime(string='End Time', compute='_compute_end_date', store=True)
     appointment_type = fields.Selection([
@@ -49,6 +69,8 @@ class ClinicAppointment(models.Model):
     internal_notes = fields.Text(string='Internal Notes')
     
     # Related Records
+    series_id = fields.Many2one('clinic.appointment.series', string='Series', index=True,
+                                ondelete='set null', copy=False)
     treatment_id = fields.Many2one('clinic.treatment', string='Treatment Record')
     invoice_id = fields.Many2one('account.move', string='Invoice', readonly=True)
     
@@ -71,14 +93,32 @@ class ClinicAppointment(models.Model):
     company_id = fields.Many2one('res.company', string='Company', required=True,
                                 default=lambda self: self.env.company)
     
+    # Archived once past the archive horizon, keeping the scheduling working set small
+    active = fields.Boolean(default=True)
+    
     # Calendar Integration
     calendar_event_id = fields.Many2one('calendar.event', string='Calendar Event')
+    calendar_sync_pending = fields.Boolean(string='Calendar Sync Pending', copy=False,
+                                           help='Calendar event changes deferred to the sync cron')
     
     # Computed Fields
     patient_phone = fields.Char(related='patient_id.phone', string='Patient Phone')
     patient_email = fields.Char(related='patient_id.email', string='Patient Email')
     patient_age = fields.Integer(related='patient_id.age', string='Age')
     
+    def init(self):
+        # Serves the overlap self-join of _check_appointment_conflict, on live appointments only
+        self.env.cr.execute("DROP INDEX IF EXISTS clinic_appointment_doctor_slot_idx")
+        create_index(self.env.cr, 'clinic_appointment_doctor_slot_active_idx', self._table,
+                     ['doctor_id', 'date', 'end_date'],
+                     where="active AND state NOT IN ('cancelled', 'no_show')")
+        # Reminder cron: upcoming confirmed appointments
+        create_index(self.env.cr, 'clinic_appointment_reminder_idx', self._table, ['date'],
+                     where="state = 'confirmed'")
+        # Deferred calendar sync queue
+        create_index(self.env.cr, 'clinic_appointment_calendar_sync_idx', self._table, ['id'],
+                     where="calendar_sync_pending")
+    
     @api.depends('date', 'duration')
     def _compute_end_date(self):
         for rec in self:
@@ -96,74 +136,260 @@ class ClinicAppointment(models.Model):
                 rec.reminder_date = False
     
     @api.model_create_multi
+    @track_performance
     def create(self, vals_list):
         for vals in vals_list:
             if vals.get('appointment_code', 'New') == 'New':
                 vals['appointment_code'] = self.env['ir.sequence'].next_by_code('clinic.appointment') or 'New'
         appointments = super().create(vals_list)
-        appointments._create_calendar_events()
+        self.env['clinic.dashboard']._invalidate_cache()
+        self.env['clinic.doctor.capacity']._invalidate_capacity(appointments._get_capacity_weeks())
+        if self.env.context.get('clinic_defer_calendar_sync'):
+            appointments.calendar_sync_pending = True
+        else:
+            appointments._create_calendar_events()
         return appointments
     
+    @track_performance
     def write(self, vals):
+        capacity_weeks = self._get_capacity_weeks() if any(field in vals for field in CAPACITY_FIELDS) else set()
         res = super().write(vals)
-        if any(field in vals for field in ['date', 'duration', 'doctor_id', 'patient_id', 'state']):
-            self._update_calendar_events()
+        self.env['clinic.dashboard']._invalidate_cache()
+        if capacity_weeks:
+            self.env['clinic.doctor.capacity']._invalidate_capacity(capacity_weeks | self._get_capacity_weeks())
+        if any(field in vals for field in CALENDAR_SYNC_FIELDS):
+            if self.env.context.get('clinic_defer_calendar_sync'):
+                self.calendar_sync_pending = True
+            else:
+                self._update_calendar_events(vals)
         return res
     
-    def _create_calendar_events(self):
-        for rec in self:
-            if not rec.calendar_event_id and rec.state not in ['cancelled', 'no_show']:
-                # Only create calendar event if doctor has a user account
-                if rec.doctor_id.user_id:
-                    event_vals = {
-                        'name': f"Appointment - {rec.patient_id.full_name}",
-                        'start': rec.date,
-                        'stop': rec.end_date,
-                        'user_id': rec.doctor_id.user_id.id,
-                        'partner_ids': [(4, rec.patient_id.partner_id.id)] if rec.patient_id.partner_id else [],
-                        'description': f"Type: {rec.appointment_type}\nDepartment: {rec.department}\n{rec.chief_complaint or ''}",
-                    }
-                    event = self.env['calendar.event'].create(event_vals)
-                    rec.calendar_event_id = event
-    
-    def _update_calendar_events(self):
+    def _shift_dates(self, delta):
+        """Move the appointments by ``delta`` of local time with a single UPDATE.
+
+        The new dates are tracked and the side effects of write() are replayed,
+        but overlaps are not checked: the caller runs _check_appointment_conflict()
+        once all the changes of the batch are applied.
+        """
+        if not self or not delta:
+            return
+        capacity_weeks = self._get_capacity_weeks()
+        self._track_prepare(['date'])
+        self.flush_recordset(['date'])
+        # Converting through the user's timezone keeps the local time of day across DST changes
+        self.env.cr.execute("""
+            UPDATE clinic_appointment
+               SET date = ((date AT TIME ZONE 'UTC' AT TIME ZONE %(tz)s) + %(delta)s)
+                          AT TIME ZONE %(tz)s AT TIME ZONE 'UTC',
+                   write_uid = %(uid)s,
+                   write_date = %(now)s
+             WHERE id IN %(ids)s
+        """, {
+            'tz': self.env.user.tz or 'UTC',
+            'delta': delta,
+            'uid': self.env.uid,
+            'now': fields.Datetime.now(),
+            'ids': tuple(self.ids),
+        })
+        self.invalidate_recordset(['date', 'write_uid', 'write_date'])
+        self.modified(['date'])
+        self.env['clinic.dashboard']._invalidate_cache()
+        self.env['clinic.doctor.capacity']._invalidate_capacity(capacity_weeks | self._get_capacity_weeks())
+        if self.env.context.get('clinic_defer_calendar_sync'):
+            self.calendar_sync_pending = True
+        else:
+            self._update_calendar_events(['date'])
+    
+    def unlink(self):
+        self.env['clinic.doctor.capacity']._invalidate_capacity(self._get_capacity_weeks())
+        return super().unlink()
+    
+    def _get_capacity_weeks(self):
+        """Return the (doctor_id, week_start) pairs of the capacity cache touched by these appointments"""
+        weeks = set()
         for rec in self:
-            if rec.calendar_event_id:
-                if rec.state in ['cancelled', 'no_show']:
-                    rec.calendar_event_id.unlink()
-                else:
-                    # Only update if doctor has user account
-                    if rec.doctor_id.user_id:
-                        rec.calendar_event_id.write({
-                            'start': rec.date,
-                            'stop': rec.end_date,
-                            'user_id': rec.doctor_id.user_id.id,
-                        })
+            if not rec.doctor_id or not rec.date:
+                continue
+            # Local days may start up to a day apart from UTC ones
+            day = rec.date.date() - timedelta(days=1)
+            while day <= (rec.end_date or rec.date).date() + timedelta(days=1):
+                weeks.add((rec.doctor_id.id, day - timedelta(days=day.weekday())))
+                day += timedelta(days=1)
+        return weeks
+    
+    def _prepare_calendar_event_vals(self):
+        self.ensure_one()
+        return {
+            'name': f"Appointment - {self.patient_id.full_name}",
+            'start': self.date,
+            'stop': self.end_date,
+            'user_id': self.doctor_id.user_id.id,
+            'partner_ids': [(4, self.patient_id.partner_id.id)] if self.patient_id.partner_id else [],
+            'description': f"Type: {self.appointment_type}\nDepartment: {self.department}\n{self.chief_complaint or ''}",
+        }
+    
+    def _create_calendar_events(self):
+        # Only create calendar event if doctor has a user account
+        appointments = self.filtered(lambda a: not a.calendar_event_id
+                                     and a.state not in INACTIVE_STATES
+                                     and a.doctor_id.user_id)
+        if not appointments:
+            return
+        events = self.env['calendar.event'].create(
+            [rec._prepare_calendar_event_vals() for rec in appointments])
+        # Link all events in one statement instead of one write per appointment
+        self.flush_model(['calendar_event_id'])
+        self.env.cr.execute("""
+            UPDATE clinic_appointment AS a
+               SET calendar_event_id = v.event_id
+              FROM unnest(%s::int[], %s::int[]) AS v(id, event_id)
+             WHERE a.id = v.id
+        """, [appointments.ids, events.ids])
+        appointments.invalidate_recordset(['calendar_event_id'])
+    
+    def _update_calendar_events(self, fnames=CALENDAR_SYNC_FIELDS):
+        appointments = self.filtered('calendar_event_id')
+        cancelled = appointments.filtered(lambda a: a.state in INACTIVE_STATES)
+        if cancelled:
+            cancelled.calendar_event_id.unlink()
+        if not any(fname in fnames for fname in ('date', 'duration', 'doctor_id')):
+            return
+        # Only update if doctor has user account; events sharing the same values are written together
+        events_by_vals = defaultdict(lambda: self.env['calendar.event'])
+        for rec in (appointments - cancelled).filtered(lambda a: a.doctor_id.user_id):
+            events_by_vals[(rec.date, rec.end_date, rec.doctor_id.user_id.id)] |= rec.calendar_event_id
+        for (start, stop, user_id), events in events_by_vals.items():
+            events.write({
+                'start': start,
+                'stop': stop,
+                'user_id': user_id,
+            })
+    
+    @api.model
+    @track_performance
+    def _cron_sync_calendar_events(self, batch_size=1000):
+        """Cron job to flush calendar changes deferred with the clinic_defer_calendar_sync context key"""
+        pending = self.search([('calendar_sync_pending', '=', True)])
+        for ids in split_every(batch_size, pending.ids):
+            appointments = self.browse(ids)
+            appointments._update_calendar_events()
+            appointments._create_calendar_events()
+            appointments.calendar_sync_pending = False
     
     @api.constrains('date', 'doctor_id', 'duration')
     def _check_appointment_conflict(self):
-        for rec in self:
-            if rec.state not in ['cancelled', 'no_show']:
-                domain = [
-                    ('doctor_id', '=', rec.doctor_id.id),
-                    ('date', '<', rec.end_date),
-                    ('end_date', '>', rec.date),
-                    ('state', 'not in', ['cancelled', 'no_show']),
-                    ('id', '!=', rec.id),
-                ]
-                if self.search_count(domain) > 0:
-                    raise ValidationError(_('This doctor already has an appointment scheduled at this time.'))
+        conflicts = self._get_conflicting_appointments()
+        if conflicts:
+            appointment, other = conflicts[0]
+            raise ValidationError(_(
+                'This doctor already has an appointment scheduled at this time (%(code)s overlaps %(other)s).',
+                code=appointment.appointment_code, other=other.appointment_code,
+            ))
+    
+    def _get_conflicting_appointments(self):
+        """Return (appointment, other) pairs of overlapping bookings for the same doctor.
+
+        The whole recordset is checked with a single self-join, so records created
+        in the same batch are also checked against each other.
+        """
+        if not self.ids:
+            return []
+        self.flush_model(['doctor_id', 'date', 'end_date', 'state', 'active'])
+        self.env.cr.execute(self._get_conflict_query())
+        return [(self.browse(a_id), self.browse(b_id)) for a_id, b_id in self.env.cr.fetchall()]
     
+    def _get_conflict_query(self):
+        return SQL("""
+            SELECT a.id, b.id
+              FROM clinic_appointment a
+              JOIN clinic_appointment b
+                ON b.doctor_id = a.doctor_id
+               AND b.id != a.id
+               AND b.date < a.end_date
+               AND b.end_date > a.date
+               AND b.active
+               AND b.state NOT IN %s
+             WHERE a.id IN %s
+               AND a.state NOT IN %s
+          ORDER BY a.id, b.id
+        """, INACTIVE_STATES, tuple(self.ids), INACTIVE_STATES)
+    
+    @api.model
+    @track_performance
+    def get_available_slots(self, doctor_ids, date_from, date_to, service_ids=None, duration=None):
+        """Return the free slots of one or many doctors over a date range.
+
+        Slots last ``duration`` hours, or the total duration of ``service_ids``,
+        and fall within each doctor's working hours.
+
+        :return: {doctor_id: [(start, end), ...]} as UTC datetime strings
+        """
+        self.check_access('read')
+        if not doctor_ids:
+            return {}
+        doctors = self.env['hr.employee'].browse(doctor_ids)
+        date_from = max(fields.Datetime.to_datetime(date_from), fields.Datetime.now().replace(microsecond=0))
+        date_to = fields.Datetime.to_datetime(date_to)
+        if not duration:
+            services = self.env['clinic.service'].browse(service_ids or [])
+            duration = sum(services.mapped('duration')) or self.default_get(['duration'])['duration']
+        if not isinstance(duration, (int, float)) or duration <= 0:
+            raise UserError(_('The duration of the slots must be positive.'))
+        slot = timedelta(hours=duration)
+        
+        result = {doctor_id: [] for doctor_id in doctors.ids}
+        if not doctors or date_from >= date_to:
+            return result
+        
+        # Booked intervals of all doctors, sorted for a single sweep per doctor
+        booked = defaultdict(list)
+        self.flush_model(['doctor_id', 'date', 'end_date', 'state'])
+        self.env.cr.execute("""
+            SELECT doctor_id, date, end_date
+              FROM clinic_appointment
+             WHERE doctor_id IN %s
+               AND date < %s
+               AND end_date > %s
+               AND state NOT IN %s
+          ORDER BY doctor_id, date
+        """, [tuple(doctors.ids), date_to, date_from, INACTIVE_STATES])
+        for doctor_id, start, stop in self.env.cr.fetchall():
+            booked[doctor_id].append((start, stop))
+        
+        work_intervals = doctors._get_work_intervals(date_from, date_to)
+        for doctor_id, intervals in work_intervals.items():
+            busy = booked[doctor_id]
+            index = 0
+            slots = result[doctor_id]
+            for work_start, work_stop in intervals:
+                cursor = max(work_start, date_from)
+                work_stop = min(work_stop, date_to)
+                # Skip bookings that ended before this working interval
+                while index < len(busy) and busy[index][1] <= cursor:
+                    index += 1
+                position = index
+                while cursor + slot <= work_stop:
+                    if position < len(busy) and busy[position][0] < cursor + slot:
+                        cursor = max(cursor, busy[position][1])
+                        position += 1
+                        continue
+                    slots.append((fields.Datetime.to_string(cursor), fields.Datetime.to_string(cursor + slot)))
+                    cursor += slot
+        return result
+    
+    @track_performance
     def action_confirm(self):
         self.ensure_one()
         if self.state == 'draft':
             self.state = 'confirmed'
             # Send confirmation email/SMS here
     
+    @track_performance
     def action_mark_arrived(self):
         self.ensure_one()
         self.state = 'arrived'
     
+    @track_performance
     def action_start_consultation(self):
         self.ensure_one()
         self.state = 'in_progress'
@@ -187,6 +413,7 @@ class ClinicAppointment(models.Model):
             'target': 'current',
         }
     
+    @track_performance
     def action_done(self):
         self.ensure_one()
         if self.state == 'in_progress':
@@ -194,11 +421,13 @@ class ClinicAppointment(models.Model):
             if self.treatment_id:
                 self.treatment_id.state = 'done'
     
+    @track_performance
     def action_cancel(self):
         self.state = 'cancelled'
         if self.calendar_event_id:
             self.calendar_event_id.unlink()
     
+    @track_performance
     def action_no_show(self):
         self.state = 'no_show'
     
@@ -212,16 +441,92 @@ class ClinicAppointment(models.Model):
             'context': {'default_appointment_id': self.id}
         }
     
+    def action_edit_series(self):
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': 'clinic.appointment.series.edit.wizard',
+            'view_mode': 'form',
+            'target': 'new',
+            'context': {'default_appointment_id': self.id}
+        }
+    
     @api.model
-    def send_appointment_reminders(self):
-        """Cron job to send appointment reminders"""
-        tomorrow = fields.Datetime.now() + timedelta(days=1)
-        appointments = self.search([
-            ('date', '>=', fields.Datetime.now()),
-            ('date', '<=', tomorrow),
+    def _get_archive_date(self):
+        """Records dated before this are archived, see medical_clinic.archive_horizon_days"""
+        days = int(self.env['ir.config_parameter'].sudo().get_param('medical_clinic.archive_horizon_days', 730))
+        return fields.Datetime.now() - timedelta(days=days)
+    
+    @api.model
+    @track_performance
+    def _cron_archive_history(self, batch_size=5000):
+        """Cron job to archive closed appointments older than the archive horizon
+
+        Rows are archived in chunks with a single UPDATE each, committed between
+        chunks. Archived appointments stay reachable from the patient chart, but
+        leave the default views, the conflict check and its partial index.
+        """
+        auto_commit = not getattr(threading.current_thread(), 'testing', False)
+        archive_date = self._get_archive_date()
+        started = time.perf_counter()
+        archived = 0
+        self.flush_model(['active', 'state', 'date'])
+        while True:
+            self.env.cr.execute("""
+                UPDATE clinic_appointment
+                   SET active = false
+                 WHERE id IN (SELECT id
+                                FROM clinic_appointment
+                               WHERE active
+                                 AND state IN %s
+                                 AND date < %s
+                               LIMIT %s)
+             RETURNING id
+            """, [ARCHIVE_STATES, archive_date, batch_size])
+            ids = [row[0] for row in self.env.cr.fetchall()]
+            if not ids:
+                break
+            self.browse(ids).invalidate_recordset(['active'])
+            archived += len(ids)
+            if auto_commit:
+                self.env.cr.commit()
+        elapsed = time.perf_counter() - started
+        _logger.info("Appointment archival: %d archived before %s in %.2fs",
+                     archived, archive_date, elapsed)
+        return {'archived': archived, 'duration': elapsed}
+    
+    @api.model
+    @track_performance
+    def send_appointment_reminders(self, batch_size=500):
+        """Cron job to send appointment reminders
+
+        Appointments are processed in chunks of ``batch_size``: reminders of a
+        chunk are rendered and queued as mail.mail in one batch, flagged with a
+        single write, and committed so an interrupted run resumes where it stopped.
+        """
+        template = self.env.ref('medical_clinic.mail_template_appointment_reminder', raise_if_not_found=False)
+        auto_commit = not getattr(threading.current_thread(), 'testing', False)
+        now = fields.Datetime.now()
+        domain = [
+            ('date', '>=', now),
+            ('date', '<=', now + timedelta(days=1)),
             ('state', '=', 'confirmed'),
             ('reminder_sent', '=', False)
-        ])
-        for appointment in appointments:
-            # Send reminder email/SMS
-            appointment.reminder_sent = True
+        ]
+        started = time.perf_counter()
+        sent = chunks = 0
+        while True:
+            appointments = self.search(domain, order='id', limit=batch_size)
+            if not appointments:
+                break
+            if template:
+                template.send_mail_batch(appointments.ids)
+            appointments.write({'reminder_sent': True})
+            sent += len(appointments)
+            chunks += 1
+            if auto_commit:
+                self.env.cr.commit()
+        elapsed = time.perf_counter() - started
+        _logger.info("Appointment reminders: %d sent in %d chunk(s), %.2fs (%.1f/s)",
+                     sent, chunks, elapsed, sent / elapsed if elapsed else 0.0)
+        return {'sent': sent, 'chunks': chunks, 'duration': elapsed}
@@ -0,0 +1,157 @@
+import pytz
+from dateutil.relativedelta import relativedelta
+
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError, ValidationError
+
+from .perf_log import track_performance
+
+# Occurrences still open to series-wide edits
+EDITABLE_STATES = ('draft', 'confirmed')
+
+
+class ClinicAppointmentSeries(models.Model):
+    _name = 'clinic.appointment.series'
+    _description = 'Recurring Appointment Series'
+    _inherit = ['mail.thread']
+    _order = 'start_date desc'
+    
+    name = fields.Char(string='Series', required=True, copy=False, default='New', readonly=True)
+    patient_id = fields.Many2one('clinic.patient', string='Patient', required=True,
+                                 tracking=True, ondelete='restrict')
+    doctor_id = fields.Many2one('hr.employee', string='Doctor/Dentist', required=True,
+                                domain=[('is_medical_professional', '=', True)], tracking=True)
+    appointment_type = fields.Selection(
+        selection=lambda self: self.env['clinic.appointment']._fields['appointment_type'].selection,
+        string='Type', required=True, default='follow_up')
+    department = fields.Selection(
+        selection=lambda self: self.env['clinic.appointment']._fields['department'].selection,
+        string='Department', required=True, default='general')
+    service_ids = fields.Many2many('clinic.service', string='Services')
+    chief_complaint = fields.Text(string='Chief Complaint')
+    
+    # Recurrence Rule
+    start_date = fields.Datetime(string='First Occurrence', required=True, tracking=True)
+    duration = fields.Float(string='Duration (hours)', default=0.5)
+    interval = fields.Integer(string='Repeat Every', required=True, default=1)
+    rule_type = fields.Selection([
+        ('daily', 'Days'),
+        ('weekly', 'Weeks'),
+        ('monthly', 'Months'),
+    ], string='Unit', required=True, default='weekly')
+    count = fields.Integer(string='Occurrences', required=True, default=12)
+    
+    appointment_ids = fields.One2many('clinic.appointment', 'series_id', string='Appointments')
+    appointment_count = fields.Integer(string='Appointments', compute='_compute_appointment_count')
+    
+    company_id = fields.Many2one('res.company', string='Company', required=True,
+                                 default=lambda self: self.env.company)
+    
+    _sql_constraints = [
+        ('interval_positive', 'CHECK(interval > 0)', 'The repeat interval must be positive.'),
+        ('count_positive', 'CHECK(count > 0)', 'A series needs at least one occurrence.'),
+    ]
+    
+    @api.depends('appointment_ids')
+    def _compute_appointment_count(self):
+        counts = {
+            series.id: count
+            for series, count in self.env['clinic.appointment']._read_group(
+                [('series_id', 'in', self.ids)], ['series_id'], ['__count'])
+        }
+        for series in self:
+            series.appointment_count = counts.get(series._origin.id, 0)
+    
+    @api.model_create_multi
+    def create(self, vals_list):
+        for vals in vals_list:
+            if vals.get('name', 'New') == 'New':
+                vals['name'] = self.env['ir.sequence'].next_by_code('clinic.appointment.series') or 'New'
+        return super().create(vals_list)
+    
+    def _get_occurrence_dates(self):
+        """Return the naive UTC start of each occurrence.
+
+        The rule is applied in the user's timezone so occurrences keep their
+        local time of day across daylight saving changes.
+        """
+        self.ensure_one()
+        tz = pytz.timezone(self.env.user.tz or 'UTC')
+        local_start = pytz.utc.localize(self.start_date).astimezone(tz).replace(tzinfo=None)
+        unit = {'daily': 'days', 'weekly': 'weeks', 'monthly': 'months'}[self.rule_type]
+        return [
+            tz.localize(local_start + relativedelta(**{unit: self.interval * index}))
+              .astimezone(pytz.utc).replace(tzinfo=None)
+            for index in range(self.count)
+        ]
+    
+    def _prepare_appointment_vals(self, date):
+        self.ensure_one()
+        return {
+            'series_id': self.id,
+            'patient_id': self.patient_id.id,
+            'doctor_id': self.doctor_id.id,
+            'date': date,
+            'duration': self.duration,
+            'appointment_type': self.appointment_type,
+            'department': self.department,
+            'service_ids': [(6, 0, self.service_ids.ids)],
+            'chief_complaint': self.chief_complaint,
+            'company_id': self.company_id.id,
+        }
+    
+    @track_performance
+    def action_generate_appointments(self):
+        """Create every occurrence in one batch: the conflict check runs once for the
+        whole series and calendar events are created together"""
+        if self.appointment_ids:
+            raise UserError(_('Appointments have already been generated for this series.'))
+        vals_list = [
+            series._prepare_appointment_vals(date)
+            for series in self
+            for date in series._get_occurrence_dates()
+        ]
+        self.env['clinic.appointment'].create(vals_list)
+        return self.action_view_appointments()
+    
+    def action_view_appointments(self):
+        return {
+            'type': 'ir.actions.act_window',
+            'name': _('Appointments'),
+            'res_model': 'clinic.appointment',
+            'view_mode': 'tree,form,calendar',
+            'domain': [('series_id', 'in', self.ids)],
+            'context': {'default_series_id': self.id if len(self) == 1 else False},
+        }
+    
+    def _get_following_appointments(self, appointment):
+        """Open occurrences of the series from ``appointment`` onwards"""
+        self.ensure_one()
+        return self.env['clinic.appointment'].search([
+            ('series_id', '=', self.id),
+            ('date', '>=', appointment.date),
+            ('state', 'in', EDITABLE_STATES),
+        ], order='date')
+    
+    @api.model
+    def _shift_appointments(self, appointments, delta, vals=None):
+        """Move ``appointments`` by ``delta`` of local time and apply ``vals`` to them.
+
+        All the dates move with one UPDATE and ``vals`` is written once through
+        the ORM, so the conflict check runs a single time, on the final schedule.
+        """
+        vals = vals or {}
+        if not appointments or not (delta or vals):
+            return
+        appointments._shift_dates(delta)
+        if vals:
+            appointments.write(vals)
+        if not vals.keys() & {'doctor_id', 'duration'}:
+            # The constraint did not run in write()
+            appointments._check_appointment_conflict()
+    
+    @api.constrains('duration')
+    def _check_duration(self):
+        for series in self:
+            if series.duration <= 0:
+                raise ValidationError(_('The duration of the appointments must be positive.'))
@@ -0,0 +1,466 @@
+import json
+import logging
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from odoo import models, fields, api, Command, _
+from odoo.exceptions import UserError
+from odoo.tools import SQL, split_every
+
+from .appointment import INACTIVE_STATES
+
+_logger = logging.getLogger(__name__)
+
+# Last accepted EXPLAIN ANALYZE results, as JSON
+EXPLAIN_BASELINE_PARAM = 'medical_clinic.explain_baseline'
+# Keeps seeding cheap: no chatter, calendar and partner updates left to their crons
+SEED_CONTEXT = {
+    'tracking_disable': True,
+    'mail_create_nolog': True,
+    'mail_notrack': True,
+    'clinic_defer_calendar_sync': True,
+    'clinic_defer_partner_sync': True,
+}
+FIRST_NAMES = ('James', 'Mary', 'John', 'Patricia', 'Robert', 'Jennifer', 'Michael', 'Linda',
+               'David', 'Elizabeth', 'Ahmed', 'Fatima', 'Wei', 'Mei', 'Carlos', 'Lucia')
+LAST_NAMES = ('Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis',
+              'Rodriguez', 'Martinez', 'Hernandez', 'Lopez', 'Wilson', 'Anderson', 'Chen', 'Khan')
+# Half-hour slots booked per doctor and day by the generator
+SLOTS_PER_DAY = 16
+# Columns of the patient list view
+PATIENT_LIST_FIELDS = ['patient_code', 'full_name', 'age', 'gender', 'phone', 'last_visit_date', 'state']
+DEPARTMENTS = ('general', 'dental', 'cardiology', 'orthopedics', 'pediatrics', 'dermatology')
+
+
+class ClinicBenchmark(models.AbstractModel):
+    _name = 'clinic.benchmark'
+    _description = 'Medical Clinic Benchmark'
+    
+    @api.model
+    def _seed(self, patients=10000, doctors=50, appointments_per_patient=5, treatments_per_patient=2,
+              services=40, insurance_companies=10, insured_ratio=0.6, dental_ratio=0.3,
+              history_days=730, batch_size=1000, seed=42):
+        """Create a synthetic clinic with batched creates and return the number of
+        records created per model.
+
+        Appointments are spread over ``history_days`` in the past and two months
+        ahead, in consecutive half-hour slots per doctor so they never conflict.
+        Past treatments are completed with procedures but left uninvoiced, and
+        those of insured patients carry a claim.
+        """
+        rng = random.Random(seed)
+        env = self.with_context(**SEED_CONTEXT).env
+        started = time.perf_counter()
+        now = fields.Datetime.now().replace(minute=0, second=0, microsecond=0)
+        
+        doctor_records = env['hr.employee'].create([{
+            'name': 'Benchmark Doctor %04d' % index,
+            'is_medical_professional': True,
+            'medical_specialization': rng.choice(['general', 'dentist', 'pediatrician', 'cardiologist']),
+        } for index in range(doctors)])
+        
+        prices = [rng.randrange(20, 500, 5) for _index in range(services)]
+        products = env['product.product'].create([{
+            'name': 'Benchmark Service %03d' % index,
+            'type': 'service',
+            'list_price': price,
+        } for index, price in enumerate(prices)])
+        service_records = env['clinic.service'].create([{
+            'name': product.name,
+            'code': 'BENCH%03d' % index,
+            'product_id': product.id,
+            'department': DEPARTMENTS[index % len(DEPARTMENTS)],
+            'is_procedure': True,
+            'price': price,
+        } for index, (product, price) in enumerate(zip(products, prices))])
+        service_prices = dict(zip(service_records.ids, prices))
+        
+        companies = env['res.partner'].create([{
+            'name': 'Benchmark Insurer %02d' % index,
+            'is_company': True,
+            'is_insurance_company': True,
+        } for index in range(insurance_companies)])
+        
+        patient_ids = []
+        for chunk in split_every(batch_size, range(patients)):
+            patient_ids += env['clinic.patient'].create([{
+                'first_name': rng.choice(FIRST_NAMES),
+                'last_name': '%s %05d' % (rng.choice(LAST_NAMES), index),
+                'date_of_birth': fields.Date.today() - timedelta(days=rng.randint(365, 90 * 365)),
+                'gender': rng.choice(['male', 'female']),
+                'phone': '+1 555 %07d' % index,
+                'email': 'patient%05d@example.com' % index,
+            } for index in chunk]).ids
+        
+        insurance_by_patient = {}
+        for chunk in split_every(batch_size, rng.sample(patient_ids, int(len(patient_ids) * insured_ratio))):
+            insurances = env['clinic.insurance'].create([{
+                'patient_id': patient_id,
+                'insurance_company_id': rng.choice(companies.ids),
+                'policy_number': 'POL-%08d' % patient_id,
+                'plan_type': rng.choice(['hmo', 'ppo', 'private']),
+                'start_date': fields.Date.today() - timedelta(days=history_days),
+                'coverage_percentage': 80.0,
+                'max_coverage': 10000.0,
+                'is_primary': True,
+            } for patient_id in chunk])
+            insurance_by_patient.update(zip(chunk, insurances.ids))
+        
+        chart_count = 0
+        for chunk in split_every(batch_size // 10 or 1, rng.sample(patient_ids, int(len(patient_ids) * dental_ratio))):
+            chart_count += len(env['clinic.dental.chart'].create([{'patient_id': patient_id} for patient_id in chunk]))
+            env.invalidate_all()
+        
+        # Consecutive slots per doctor, spread from the start of the history to two months ahead
+        total = patients * appointments_per_patient
+        days = max(1, -(-total // (doctors * SLOTS_PER_DAY)))
+        day_step = max(1, (history_days + 60) // days)
+        start = now.replace(hour=8) - timedelta(days=history_days)
+        
+        def slot(index):
+            doctor_index, rank = index % doctors, index // doctors
+            date = start + timedelta(days=(rank // SLOTS_PER_DAY) * day_step, minutes=30 * (rank % SLOTS_PER_DAY))
+            if date < now:
+                state = rng.choices(['done', 'cancelled', 'no_show'], [8, 1, 1])[0]
+            else:
+                state = rng.choice(['draft', 'confirmed'])
+            return doctor_records[doctor_index].id, date, state
+        
+        appointment_count = treatment_count = claim_count = 0
+        for chunk in split_every(batch_size, range(total)):
+            vals_list = []
+            for index in chunk:
+                doctor_id, date, state = slot(index)
+                vals_list.append({
+                    'patient_id': patient_ids[rng.randrange(patients)],
+                    'doctor_id': doctor_id,
+                    'date': date,
+                    'duration': 0.5,
+                    'state': state,
+                    'appointment_type': 'consultation',
+                })
+            appointments = env['clinic.appointment'].create(vals_list)
+            appointment_count += len(appointments)
+            # Keep treatments_per_patient for appointments_per_patient visits
+            done = appointments.filtered(lambda a: a.state == 'done')
+            done = done[:len(chunk) * treatments_per_patient // max(appointments_per_patient, 1)]
+            treatments = env['clinic.treatment'].create([{
+                'patient_id': appointment.patient_id.id,
+                'doctor_id': appointment.doctor_id.id,
+                'appointment_id': appointment.id,
+                'date': appointment.date,
+                'chief_complaint': 'Benchmark consultation',
+                'procedure_ids': [Command.set(rng.sample(service_records.ids, rng.randint(1, 3)))],
+                'state': 'done',
+            } for appointment in done])
+            treatment_count += len(treatments)
+            claims = env['clinic.insurance.claim'].create([
+                self._prepare_seed_claim_vals(rng, treatment, insurance_by_patient[treatment.patient_id.id],
+                                              sum(service_prices[service_id] for service_id in treatment.procedure_ids.ids))
+                for treatment in treatments
+                if treatment.patient_id.id in insurance_by_patient
+            ])
+            claim_count += len(claims)
+            env.invalidate_all()
+        
+        self._analyze_tables()
+        counts = {
+            'hr.employee': len(doctor_records),
+            'clinic.service': len(service_records),
+            'clinic.patient': len(patient_ids),
+            'clinic.insurance': len(insurance_by_patient),
+            'clinic.dental.chart': chart_count,
+            'clinic.appointment': appointment_count,
+            'clinic.treatment': treatment_count,
+            'clinic.insurance.claim': claim_count,
+        }
+        _logger.info("Benchmark dataset: %s created in %.2fs", counts, time.perf_counter() - started)
+        return counts
+    
+    @api.model
+    def _prepare_seed_claim_vals(self, rng, treatment, insurance_id, amount):
+        state = rng.choices(['draft', 'submitted', 'in_review', 'approved', 'rejected', 'paid'],
+                            [2, 2, 1, 2, 1, 4])[0]
+        approved = round(amount * 0.8, 2) if state in ('approved', 'paid') else 0.0
+        return {
+            'patient_id': treatment.patient_id.id,
+            'insurance_id': insurance_id,
+            'treatment_id': treatment.id,
+            'claim_date': treatment.date.date(),
+            'service_date': treatment.date.date(),
+            'amount_claimed': amount,
+            'amount_approved': approved,
+            'amount_paid': approved if state == 'paid' else 0.0,
+            'state': state,
+        }
+    
+    @api.model
+    def _analyze_tables(self):
+        # Fresh planner statistics, as the autovacuum daemon does not see uncommitted rows
+        self.env.flush_all()
+        for table in ('clinic_patient', 'clinic_appointment', 'clinic_treatment', 'clinic_insurance',
+                      'clinic_insurance_claim', 'clinic_dental_chart', 'clinic_dental_tooth', 'ir_attachment'):
+            self.env.cr.execute(SQL("ANALYZE %s", SQL.identifier(table)))
+    
+    @api.model
+    def _get_hot_queries(self):
+        """Return (label, SQL) of the queries behind the module's hot paths"""
+        now = fields.Datetime.now()
+        appointment = self.env['clinic.appointment'].search([('state', 'not in', INACTIVE_STATES)],
+                                                            order='id desc', limit=1)
+        patient_id = appointment.patient_id.id or 0
+        treatment = self.env['clinic.treatment'].search([], order='id desc', limit=1)
+        hot_domains = [
+            ('appointment_doctor_agenda', 'clinic.appointment', [
+                ('doctor_id', '=', appointment.doctor_id.id or 0),
+                ('date', '>=', now),
+                ('date', '<', now + timedelta(days=7)),
+                ('state', 'not in', INACTIVE_STATES),
+            ], 'date', None),
+            ('appointment_reminders', 'clinic.appointment', [
+                ('date', '>=', now),
+                ('date', '<=', now + timedelta(days=1)),
+                ('state', '=', 'confirmed'),
+                ('reminder_sent', '=', False),
+            ], 'id', 500),
+            ('appointment_calendar_sync', 'clinic.appointment', [('calendar_sync_pending', '=', True)], 'id', None),
+            ('appointment_patient_history', 'clinic.appointment', [('patient_id', '=', patient_id)], 'date desc', None),
+            ('appointment_list', 'clinic.appointment', [], None, 80),
+            ('treatment_patient_history', 'clinic.treatment', [('patient_id', '=', patient_id)], None, None),
+            ('treatment_to_invoice', 'clinic.treatment', [
+                ('state', '=', 'done'),
+                ('invoice_id', '=', False),
+                ('procedure_ids', '!=', False),
+            ], 'patient_id, id', 500),
+            ('insurance_patient', 'clinic.insurance', [('patient_id', '=', patient_id)], None, None),
+            ('claim_open', 'clinic.insurance.claim', [('state', 'in', ('submitted', 'in_review'))], 'id', 2000),
+            ('attachment_record', 'ir.attachment', [
+                ('res_model', '=', 'clinic.treatment'),
+                ('res_id', '=', treatment.id or 0),
+            ], None, None),
+            ('patient_search', 'clinic.patient', [('full_name', 'ilike', 'smith')], None, 8),
+            ('patient_partner_sync', 'clinic.patient', [('partner_sync_pending', '=', True)], None, None),
+        ]
+        queries = [
+            (label, self.env[model]._search(domain, order=order, limit=limit).select())
+            for label, model, domain, order, limit in hot_domains
+        ]
+        queries.append(('appointment_conflict', appointment._get_conflict_query()))
+        return queries
+    
+    @api.model
+    def _explain(self, query):
+        self.env.cr.execute(SQL("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) %s", query))
+        plan = self.env.cr.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        plan = plan[0]
+        nodes = []
+        stack = [plan['Plan']]
+        while stack:
+            node = stack.pop()
+            nodes.append(node)
+            stack.extend(node.get('Plans', []))
+        return {
+            'execution_ms': plan['Execution Time'],
+            'planning_ms': plan['Planning Time'],
+            'indexes': sorted({node['Index Name'] for node in nodes if 'Index Name' in node}),
+            'seq_scans': sorted({node['Relation Name'] for node in nodes if node['Node Type'] == 'Seq Scan'}),
+        }
+    
+    @api.model
+    def _compare_explain(self, results, baseline, tolerance=1.5):
+        """Return the regressions of ``results`` against ``baseline``: queries slower by
+        more than ``tolerance`` times (and 1ms), or scanning a table they did not scan"""
+        regressions = []
+        for label, result in results.items():
+            reference = baseline.get(label)
+            if not reference:
+                continue
+            if result['execution_ms'] > max(reference['execution_ms'] * tolerance, reference['execution_ms'] + 1.0):
+                regressions.append({'query': label, 'reason': 'slower',
+                                    'execution_ms': result['execution_ms'], 'baseline_ms': reference['execution_ms']})
+            new_scans = set(result['seq_scans']) - set(reference['seq_scans'])
+            if new_scans:
+                regressions.append({'query': label, 'reason': 'seq_scan', 'tables': sorted(new_scans)})
+        return regressions
+    
+    @api.model
+    def run_explain_benchmark(self, repeat=3, tolerance=1.5, update_baseline=False, baseline=None):
+        """Time every hot query with EXPLAIN ANALYZE and compare with ``baseline``,
+        by default the stored one.
+
+        Each query runs ``repeat`` times and the fastest run is kept. With
+        ``update_baseline`` the results become the new stored baseline.
+        """
+        self.env.flush_all()
+        results = {}
+        for label, query in self._get_hot_queries():
+            results[label] = min((self._explain(query) for _run in range(repeat)),
+                                 key=lambda result: result['execution_ms'])
+            _logger.info("EXPLAIN %s: %.3fms (planning %.3fms), indexes %s, seq scans %s", label,
+                         results[label]['execution_ms'], results[label]['planning_ms'],
+                         results[label]['indexes'], results[label]['seq_scans'])
+        
+        ICP = self.env['ir.config_parameter'].sudo()
+        if baseline is None:
+            baseline = json.loads(ICP.get_param(EXPLAIN_BASELINE_PARAM) or '{}')
+        regressions = self._compare_explain(results, baseline, tolerance)
+        for regression in regressions:
+            _logger.warning("EXPLAIN regression: %s", regression)
+        if update_baseline:
+            ICP.set_param(EXPLAIN_BASELINE_PARAM, json.dumps(results, indent=1, sort_keys=True))
+        return {'results': results, 'regressions': regressions}
+    
+    @contextmanager
+    def _measure(self, results, label, calls=1):
+        """Record the queries and wall time per call of the block under ``label``.
+
+        The cache is flushed and emptied on entry, and pending writes are
+        flushed on exit, so the recomputations triggered by the block are
+        counted with it.
+        """
+        self.env.flush_all()
+        self.env.invalidate_all()
+        cr = self.env.cr
+        queries = cr.sql_log_count
+        started = time.perf_counter()
+        yield
+        self.env.flush_all()
+        duration = time.perf_counter() - started
+        results[label] = {
+            'calls': calls,
+            'queries': round((cr.sql_log_count - queries) / calls, 1),
+            'duration_ms': round(1000 * duration / calls, 3),
+        }
+        _logger.info("Benchmark %s: %.1f queries, %.3fms per call (%d call(s))", label,
+                     results[label]['queries'], results[label]['duration_ms'], calls)
+    
+    @api.model
+    def run_flow_benchmark(self, samples=20):
+        """Run the key clinic flows ``samples`` times each on the current data and
+        return their query count and wall time per call"""
+        results = {}
+        now = fields.Datetime.now().replace(minute=0, second=0, microsecond=0)
+        doctors = self.env['hr.employee'].search([('is_medical_professional', '=', True)], limit=samples)
+        patients = self.env['clinic.patient'].search([], order='id desc', limit=samples)
+        services = self.env['clinic.service'].search([('is_procedure', '=', True)], limit=3)
+        if not doctors or not patients or not services:
+            raise UserError(_('Seed the benchmark data before running the benchmark.'))
+        # After the last booked appointment: one day per booking, so bookings never conflict
+        last = self.env['clinic.appointment'].search([], order='date desc', limit=1)
+        first_slot = max(now, last.date or now).replace(hour=9, minute=0, second=0) + timedelta(days=1)
+        
+        with self._measure(results, 'booking', samples):
+            appointments = self.env['clinic.appointment']
+            for index in range(samples):
+                appointment = self.env['clinic.appointment'].create({
+                    'patient_id': patients[index % len(patients)].id,
+                    'doctor_id': doctors[index % len(doctors)].id,
+                    'date': first_slot + timedelta(days=index),
+                    'duration': 0.5,
+                    'service_ids': [Command.set(services[:1].ids)],
+                    'chief_complaint': 'Benchmark booking',
+                })
+                appointment.action_confirm()
+                appointments |= appointment
+        
+        with self._measure(results, 'start_consultation', samples):
+            for appointment in appointments:
+                appointment.action_start_consultation()
+        
+        treatments = appointments.treatment_id
+        self.env['clinic.diagnosis'].create([
+            {'treatment_id': treatment.id, 'diagnosis': 'Benchmark diagnosis', 'icd_code': 'Z00.0'}
+            for treatment in treatments
+        ])
+        treatments.procedure_ids = [Command.set(services.ids)]
+        with self._measure(results, 'complete_and_invoice', samples):
+            for treatment in treatments:
+                treatment.action_complete()
+        
+        # Confirmed appointments in the reminder window, out of the seeded working hours
+        reminder_slot = now.replace(hour=20) + timedelta(days=1 if now.hour >= 20 else 0)
+        self.env['clinic.appointment'].create([{
+            'patient_id': patients[index % len(patients)].id,
+            'doctor_id': doctors[index % len(doctors)].id,
+            'date': reminder_slot + timedelta(minutes=30 * (index // len(doctors))),
+            'duration': 0.5,
+            'state': 'confirmed',
+        } for index in range(samples)])
+        with self._measure(results, 'reminder_cron'):
+            reminders = self.env['clinic.appointment'].send_appointment_reminders()
+        results['reminder_cron']['records'] = reminders['sent']
+        
+        claims = self.env['clinic.insurance.claim'].search([('state', 'in', ('submitted', 'in_review'))],
+                                                           limit=samples)
+        if claims:
+            with self._measure(results, 'claim_totals', len(claims)):
+                for claim in claims:
+                    claim.write({'state': 'approved', 'amount_approved': claim.amount_claimed})
+                    claim.insurance_id.flush_recordset(['total_claimed', 'total_approved', 'remaining_coverage'])
+        
+        Patient = self.env['clinic.patient']
+        with self._measure(results, 'patient_list', samples):
+            for _index in range(samples):
+                Patient.invalidate_model()
+                Patient.search_read([], PATIENT_LIST_FIELDS, limit=80)
+        
+        # The conflict constraint on a week of every doctor's agenda, as a batch create or import checks it
+        week = self.env['clinic.appointment'].search([
+            ('date', '>=', now),
+            ('date', '<', now + timedelta(days=7)),
+            ('state', 'not in', INACTIVE_STATES),
+        ])
+        if week:
+            with self._measure(results, 'conflict_check'):
+                week._check_appointment_conflict()
+            results['conflict_check']['records'] = len(week)
+        
+        with self._measure(results, 'available_slots', samples):
+            for index in range(samples):
+                date_from = now + timedelta(days=index)
+                self.env['clinic.appointment'].get_available_slots(doctors.ids, date_from, date_from + timedelta(days=7))
+        
+        with self._measure(results, 'reporting'):
+            self.env['clinic.materialized.report']._cron_refresh_reports()
+            self.env['clinic.appointment.report']._read_group([], ['doctor_id'], ['appointment_count:sum', 'booked_hours:sum'])
+            self.env['clinic.service.revenue.report']._read_group([], ['service_id'], ['revenue:sum'])
+            self.env['clinic.claim.report']._read_group([], ['insurance_company_id'], ['amount_claimed:sum'])
+        
+        with self._measure(results, 'dashboard', samples):
+            for _index in range(samples):
+                self.env['clinic.dashboard']._compute_kpis()
+        return results
+    
+    @api.model
+    def _compare_flows(self, results, baseline, tolerance=1.5):
+        """Return the flows doing more queries per call than in ``baseline``, or
+        slower by more than ``tolerance`` times (and 5ms)"""
+        regressions = []
+        for label, result in results.items():
+            reference = baseline.get(label)
+            if not reference:
+                continue
+            if result['queries'] > reference['queries'] + 0.5:
+                regressions.append({'flow': label, 'reason': 'queries',
+                                    'queries': result['queries'], 'baseline_queries': reference['queries']})
+            if result['duration_ms'] > max(reference['duration_ms'] * tolerance, reference['duration_ms'] + 5.0):
+                regressions.append({'flow': label, 'reason': 'slower',
+                                    'duration_ms': result['duration_ms'], 'baseline_ms': reference['duration_ms']})
+        return regressions
+    
+    @api.model
+    def run_benchmark(self, samples=20, repeat=3, tolerance=1.5, baseline=None):
+        """Run the query plan and flow benchmarks against ``baseline``, a dict with
+        'explain' and 'flows' keys as returned here (without regressions)"""
+        baseline = baseline or {}
+        explain = self.run_explain_benchmark(repeat=repeat, tolerance=tolerance,
+                                             baseline=baseline.get('explain'))
+        flows = self.run_flow_benchmark(samples=samples)
+        regressions = explain['regressions'] + self._compare_flows(flows, baseline.get('flows', {}), tolerance)
+        for regression in regressions[len(explain['regressions']):]:
+            _logger.warning("Benchmark regression: %s", regression)
+        return {'explain': explain['results'], 'flows': flows, 'regressions': regressions}
@@ -0,0 +1,168 @@
+"""Transports exchanging insurance claim batches with payers.
+
+Transports run in worker threads: they receive plain Python data only and
+must never use the ORM or the database cursor.
+"""
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+
+class ClaimTransport:
+    """Base transport, configured with a dict of options"""
+
+    def __init__(self, options):
+        self.options = options
+
+    def send_batch(self, batch_name, payload):
+        """Deliver an X12 837 payload and return the payer reference of the batch"""
+        raise NotImplementedError()
+
+    def fetch_status(self, claim_numbers):
+        """Return {claim_number: {'status': ..., 'amount_approved': ..., 'reason': ...}}
+        for the claims the payer has an answer for"""
+        raise NotImplementedError()
+
+
+class FileDropTransport(ClaimTransport):
+    """Local stand-in for a clearinghouse: batches are dropped as files in a directory,
+    and payer answers are read back as one JSON file per claim from its inbox"""
+
+    def send_batch(self, batch_name, payload):
+        outbox = os.path.join(self.options['directory'], 'outbox')
+        os.makedirs(outbox, exist_ok=True)
+        path = os.path.join(outbox, '%s.x12' % _filename(batch_name))
+        with open(path, 'w', encoding='ascii', errors='replace') as payload_file:
+            payload_file.write(payload)
+        return path
+
+    def fetch_status(self, claim_numbers):
+        inbox = os.path.join(self.options['directory'], 'inbox')
+        results = {}
+        for number in claim_numbers:
+            path = os.path.join(inbox, '%s.json' % _filename(number))
+            if os.path.exists(path):
+                with open(path, encoding='utf-8') as answer_file:
+                    results[number] = json.load(answer_file)
+        return results
+
+
+class HttpTransport(ClaimTransport):
+    """Payer exposing a JSON status endpoint, such as MockPayerServer"""
+
+    def send_batch(self, batch_name, payload):
+        response = requests.post(self.options['url'] + '/batches', timeout=self.options.get('timeout', 30),
+                                 json={'name': batch_name, 'payload': payload})
+        response.raise_for_status()
+        return response.json()['reference']
+
+    def fetch_status(self, claim_numbers):
+        response = requests.post(self.options['url'] + '/status', timeout=self.options.get('timeout', 30),
+                                 json={'claims': list(claim_numbers)})
+        response.raise_for_status()
+        return response.json()['results']
+
+
+CLAIM_TRANSPORTS = {
+    'file': FileDropTransport,
+    'http': HttpTransport,
+}
+
+
+def get_claim_transport(name, options):
+    if name not in CLAIM_TRANSPORTS:
+        raise ValueError("Unknown claim transport %r" % name)
+    return CLAIM_TRANSPORTS[name](options)
+
+
+def _filename(name):
+    return re.sub(r'[^\w.-]', '_', name)
+
+
+class RateLimiter:
+    """Thread-safe limiter spacing calls to at most ``rate`` per second"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.next_call = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            call_at = max(now, self.next_call)
+            self.next_call = call_at + self.interval
+        if call_at > now:
+            time.sleep(call_at - now)
+
+
+class _MockPayerHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        time.sleep(self.server.latency)
+        if self.path == '/batches':
+            answer = {'reference': 'MOCK-%08X' % zlib.crc32(body.get('name', '').encode())}
+        elif self.path == '/status':
+            answer = {'results': {number: _mock_status(number) for number in body.get('claims', [])}}
+        else:
+            self.send_error(404)
+            return
+        data = json.dumps(answer).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _mock_status(claim_number):
+    # Deterministic answer per claim so benchmark runs are comparable
+    bucket = zlib.crc32(claim_number.encode()) % 10
+    if bucket < 4:
+        return {'status': 'in_review'}
+    if bucket < 8:
+        return {'status': 'approved'}
+    if bucket < 9:
+        return {'status': 'partial', 'ratio': 0.5}
+    return {'status': 'rejected', 'reason': 'Service not covered by the policy'}
+
+
+class MockPayerServer(ThreadingHTTPServer):
+    """Local HTTP payer answering batch and status requests, for benchmarking the
+    'http' transport. Use as a context manager; ``url`` is the transport url."""
+
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.05):
+        super().__init__((host, port), _MockPayerHandler)
+        self.latency = latency
+        self.url = 'http://%s:%s' % self.server_address[:2]
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Run a local mock insurance payer')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds added to each response')
+    args = parser.parse_args()
+    server = MockPayerServer(port=args.port, latency=args.latency)
+    print('Mock payer listening on %s' % server.url)
+    server.serve_forever()
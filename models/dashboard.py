@@ -0,0 +1,148 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytz
+
+from odoo import models, fields, api, _
+from odoo.exceptions import AccessError
+
+from .perf_log import track_performance
+
+# KPIs are cached per database, company set, timezone and local day. The cache
+# lives in each worker process: changes drop it in the worker that made them,
+# while other workers only refresh once the TTL expires, so it is kept short
+KPI_CACHE_TTL = 15
+_kpi_cache = {}
+_kpi_cache_lock = threading.Lock()
+
+
+class ClinicDashboard(models.AbstractModel):
+    _name = 'clinic.dashboard'
+    _description = 'Medical Clinic Dashboard'
+
+    @api.model
+    @track_performance
+    def get_kpis(self):
+        """Return every dashboard KPI for the current companies in one call"""
+        if not self.env.user.has_group('medical_clinic.group_clinic_user'):
+            raise AccessError(_('You are not allowed to access the clinic dashboard.'))
+        key = (self.env.cr.dbname, tuple(sorted(self.env.companies.ids)), self.env.user.tz or 'UTC',
+               fields.Date.context_today(self))
+        with _kpi_cache_lock:
+            cached = _kpi_cache.get(key)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+        kpis = self._compute_kpis()
+        with _kpi_cache_lock:
+            _kpi_cache[key] = (time.monotonic() + KPI_CACHE_TTL, kpis)
+        return kpis
+
+    @api.model
+    def _invalidate_cache(self):
+        dbname = self.env.cr.dbname
+        with _kpi_cache_lock:
+            for key in [key for key in _kpi_cache if key[0] == dbname]:
+                del _kpi_cache[key]
+
+    @api.model
+    def _compute_kpis(self):
+        self.env.flush_all()
+        cr = self.env.cr
+        company_ids = tuple(self.env.companies.ids)
+        tz = pytz.timezone(self.env.user.tz or 'UTC')
+        today = fields.Date.context_today(self)
+        day_start = tz.localize(datetime.combine(today, datetime.min.time())).astimezone(pytz.utc).replace(tzinfo=None)
+        day_end = day_start + timedelta(days=1)
+
+        # Today's appointments by state, and booked hours per doctor
+        cr.execute("""
+            SELECT state, doctor_id, count(*), sum(duration)
+              FROM clinic_appointment
+             WHERE company_id IN %s
+               AND date >= %s AND date < %s
+          GROUP BY state, doctor_id
+        """, [company_ids, day_start, day_end])
+        by_state = {}
+        booked_hours = {}
+        for state, doctor_id, count, hours in cr.fetchall():
+            by_state[state] = by_state.get(state, 0) + count
+            if state not in ('cancelled', 'no_show'):
+                booked_hours[doctor_id] = booked_hours.get(doctor_id, 0.0) + (hours or 0.0)
+
+        # No-show rate over the last 30 days
+        cr.execute("""
+            SELECT count(*) FILTER (WHERE state = 'no_show'),
+                   count(*) FILTER (WHERE state IN ('done', 'no_show'))
+              FROM clinic_appointment
+             WHERE company_id IN %s
+               AND date >= %s AND date < %s
+        """, [company_ids, day_end - timedelta(days=30), day_end])
+        no_shows, attended_or_missed = cr.fetchone()
+
+        # Invoiced revenue, today and month to date
+        cr.execute("""
+            SELECT coalesce(sum(amount_total_signed) FILTER (WHERE invoice_date = %s), 0),
+                   coalesce(sum(amount_total_signed), 0)
+              FROM account_move
+             WHERE company_id IN %s
+               AND patient_id IS NOT NULL
+               AND move_type IN ('out_invoice', 'out_refund')
+               AND state = 'posted'
+               AND invoice_date >= %s AND invoice_date <= %s
+        """, [today, company_ids, today.replace(day=1), today])
+        revenue_today, revenue_month = cr.fetchone()
+
+        # Open insurance claims
+        cr.execute("""
+            SELECT state, count(*), coalesce(sum(amount_claimed), 0)
+              FROM clinic_insurance_claim
+             WHERE company_id IN %s
+               AND state IN ('draft', 'submitted', 'in_review')
+          GROUP BY state
+        """, [company_ids])
+        claims_by_state = {state: {'count': count, 'amount': amount} for state, count, amount in cr.fetchall()}
+
+        # Doctor utilization: booked hours against today's working hours
+        doctors = self.env['hr.employee'].search([
+            ('is_medical_professional', '=', True),
+            ('company_id', 'in', company_ids),
+        ])
+        work_intervals = doctors._get_work_intervals(day_start, day_end)
+        utilization = []
+        for doctor in doctors:
+            available = sum((stop - start).total_seconds() for start, stop in work_intervals[doctor.id]) / 3600
+            booked = booked_hours.get(doctor.id, 0.0)
+            if available or booked:
+                utilization.append({
+                    'id': doctor.id,
+                    'name': doctor.name,
+                    'booked_hours': booked,
+                    'available_hours': available,
+                    'rate': booked / available if available else 0.0,
+                })
+        total_available = sum(line['available_hours'] for line in utilization)
+        total_booked = sum(line['booked_hours'] for line in utilization)
+
+        return {
+            'appointments': {
+                'total': sum(by_state.values()),
+                'by_state': by_state,
+            },
+            'no_show_rate': no_shows / attended_or_missed if attended_or_missed else 0.0,
+            'revenue': {
+                'today': revenue_today,
+                'month': revenue_month,
+                'currency_id': self.env.company.currency_id.id,
+            },
+            'claims': {
+                'open_count': sum(line['count'] for line in claims_by_state.values()),
+                'open_amount': sum(line['amount'] for line in claims_by_state.values()),
+                'by_state': claims_by_state,
+            },
+            'utilization': {
+                'rate': total_booked / total_available if total_available else 0.0,
+                'doctors': sorted(utilization, key=lambda line: line['rate'], reverse=True),
+            },
+            'generated_at': fields.Datetime.to_string(fields.Datetime.now()),
+        }
@@ -1,11 +1,48 @@
 from odoo import models, fields, api, _
 
+from .perf_log import track_performance
+
+# Primary teeth (A-T)
+PRIMARY_TEETH = (
+    ('A', 'Upper Right Second Molar'), ('B', 'Upper Right First Molar'),
+    ('C', 'Upper Right Canine'), ('D', 'Upper Right Lateral Incisor'),
+    ('E', 'Upper Right Central Incisor'), ('F', 'Upper Left Central Incisor'),
+    ('G', 'Upper Left Lateral Incisor'), ('H', 'Upper Left Canine'),
+    ('I', 'Upper Left First Molar'), ('J', 'Upper Left Second Molar'),
+    ('K', 'Lower Left Second Molar'), ('L', 'Lower Left First Molar'),
+    ('M', 'Lower Left Canine'), ('N', 'Lower Left Lateral Incisor'),
+    ('O', 'Lower Left Central Incisor'), ('P', 'Lower Right Central Incisor'),
+    ('Q', 'Lower Right Lateral Incisor'), ('R', 'Lower Right Canine'),
+    ('S', 'Lower Right First Molar'), ('T', 'Lower Right Second Molar'),
+)
+
+# Permanent teeth (1-32)
+PERMANENT_TEETH = (
+    ('1', 'Upper Right Third Molar'), ('2', 'Upper Right Second Molar'),
+    ('3', 'Upper Right First Molar'), ('4', 'Upper Right Second Premolar'),
+    ('5', 'Upper Right First Premolar'), ('6', 'Upper Right Canine'),
+    ('7', 'Upper Right Lateral Incisor'), ('8', 'Upper Right Central Incisor'),
+    ('9', 'Upper Left Central Incisor'), ('10', 'Upper Left Lateral Incisor'),
+    ('11', 'Upper Left Canine'), ('12', 'Upper Left First Premolar'),
+    ('13', 'Upper Left Second Premolar'), ('14', 'Upper Left First Molar'),
+    ('15', 'Upper Left Second Molar'), ('16', 'Upper Left Third Molar'),
+    ('17', 'Lower Left Third Molar'), ('18', 'Lower Left Second Molar'),
+    ('19', 'Lower Left First Molar'), ('20', 'Lower Left Second Premolar'),
+    ('21', 'Lower Left First Premolar'), ('22', 'Lower Left Canine'),
+    ('23', 'Lower Left Lateral Incisor'), ('24', 'Lower Left Central Incisor'),
+    ('25', 'Lower Right Central Incisor'), ('26', 'Lower Right Lateral Incisor'),
+    ('27', 'Lower Right Canine'), ('28', 'Lower Right First Premolar'),
+    ('29', 'Lower Right Second Premolar'), ('30', 'Lower Right First Molar'),
+    ('31', 'Lower Right Second Molar'), ('32', 'Lower Right Third Molar'),
+)
+
 class ClinicDentalChart(models.Model):
     _name = 'clinic.dental.chart'
     _description = 'Dental Chart'
     _rec_name = 'patient_id'
     
-    patient_id = fields.Many2one('clinic.patient', string='Patient', required=True, ondelete='cascade')
+    patient_id = fields.Many2one('clinic.patient', string='Patient', required=True, ondelete='cascade',
+                                 index=True)
     tooth_ids = fields.One2many('clinic.dental.tooth', 'chart_id', string='Teeth')
     last_update = fields.Datetime(string='Last Updated', compute='_compute_last_update')
     company_id = fields.Many2one('res.company', string='Company', required=True,
@@ -19,56 +56,22 @@ class ClinicDentalChart(models.Model):
             else:
                 rec.last_update = False
     
-    @api.model
-    def create(self, vals):
-        chart = super().create(vals)
-        chart._create_teeth()
-        return chart
+    @api.model_create_multi
+    @track_performance
+    def create(self, vals_list):
+        charts = super().create(vals_list)
+        charts._create_teeth()
+        return charts
     
     def _create_teeth(self):
-        """Create all 32 teeth for adult or 20 for child based on patient age"""
-        tooth_numbers = []
-        if self.patient_id.age < 13:
-            # Primary teeth (A-T)
-            tooth_numbers = [
-                ('A', 'Upper Right Second Molar'), ('B', 'Upper Right First Molar'),
-                ('C', 'Upper Right Canine'), ('D', 'Upper Right Lateral Incisor'),
-                ('E', 'Upper Right Central Incisor'), ('F', 'Upper Left Central Incisor'),
-                ('G', 'Upper Left Lateral Incisor'), ('H', 'Upper Left Canine'),
-                ('I', 'Upper Left First Molar'), ('J', 'Upper Left Second Molar'),
-                ('K', 'Lower Left Second Molar'), ('L', 'Lower Left First Molar'),
-                ('M', 'Lower Left Canine'), ('N', 'Lower Left Lateral Incisor'),
-                ('O', 'Lower Left Central Incisor'), ('P', 'Lower Right Central Incisor'),
-                ('Q', 'Lower Right Lateral Incisor'), ('R', 'Lower Right Canine'),
-                ('S', 'Lower Right First Molar'), ('T', 'Lower Right Second Molar'),
-            ]
-        else:
-            # Permanent teeth (1-32)
-            tooth_numbers = [
-                (1, 'Upper Right Third Molar'), (2, 'Upper Right Second Molar'),
-                (3, 'Upper Right First Molar'), (4, 'Upper Right Second Premolar'),
-                (5, 'Upper Right First Premolar'), (6, 'Upper Right Canine'),
-                (7, 'Upper Right Lateral Incisor'), (8, 'Upper Right Central Incisor'),
-                (9, 'Upper Left Central Incisor'), (10, 'Upper Left Lateral Incisor'),
-                (11, 'Upper Left Canine'), (12, 'Upper Left First Premolar'),
-                (13, 'Upper Left Second Premolar'), (14, 'Upper Left First Molar'),
-                (15, 'Upper Left Second Molar'), (16, 'Upper Left Third Molar'),
-                (17, 'Lower Left Third Molar'), (18, 'Lower Left Second Molar'),
-                (19, 'Lower Left First Molar'), (20, 'Lower Left Second Premolar'),
-                (21, 'Lower Left First Premolar'), (22, 'Lower Left Canine'),
-                (23, 'Lower Left Lateral Incisor'), (24, 'Lower Left Central Incisor'),
-                (25, 'Lower Right Central Incisor'), (26, 'Lower Right Lateral Incisor'),
-                (27, 'Lower Right Canine'), (28, 'Lower Right First Premolar'),
-                (29, 'Lower Right Second Premolar'), (30, 'Lower Right First Molar'),
-                (31, 'Lower Right Second Molar'), (32, 'Lower Right Third Molar'),
-            ]
-        
-        for number, name in tooth_numbers:
-            self.env['clinic.dental.tooth'].create({
-                'chart_id': self.id,
-                'number': str(number),
-                'name': name,
-            })
+        """Create all 32 teeth for adult or 20 for child based on patient age,
+        for every chart of the recordset in a single batch"""
+        tooth_vals_list = [
+            {'chart_id': chart.id, 'number': number, 'name': name}
+            for chart in self
+            for number, name in (PRIMARY_TEETH if chart.patient_id.age < 13 else PERMANENT_TEETH)
+        ]
+        self.env['clinic.dental.tooth'].create(tooth_vals_list)
 
 
 class ClinicDentalTooth(models.Model):
@@ -76,7 +79,8 @@ class ClinicDentalTooth(models.Model):
     _description = 'Dental Tooth'
     _rec_name = 'display_name'
     
-    chart_id = fields.Many2one('clinic.dental.chart', string='Dental Chart', required=True, ondelete='cascade')
+    chart_id = fields.Many2one('clinic.dental.chart', string='Dental Chart', required=True, ondelete='cascade',
+                               index=True)
     number = fields.Char(string='Tooth Number', required=True)
     name = fields.Char(string='Tooth Name', required=True)
     display_name = fields.Char(string='Display Name', compute='_compute_display_name', store=True)
@@ -119,8 +123,9 @@ class ClinicDentalProcedure(models.Model):
     _description = 'Dental Procedure'
     _order = 'date desc'
     
-    tooth_id = fields.Many2one('clinic.dental.tooth', string='Tooth', required=True, ondelete='cascade')
-    treatment_id = fields.Many2one('clinic.treatment', string='Treatment', required=True)
+    tooth_id = fields.Many2one('clinic.dental.tooth', string='Tooth', required=True, ondelete='cascade',
+                               index=True)
+    treatment_id = fields.Many2one('clinic.treatment', string='Treatment', required=True, index=True)
     date = fields.Datetime(string='Date', required=True, default=fields.Datetime.now)
     
     procedure_type = fields.Selection([
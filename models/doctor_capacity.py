@@ -0,0 +1,221 @@
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime, time as dt_time, timedelta
+
+import pytz
+
+from odoo import models, fields, api
+from odoo.tools import split_every
+
+from .appointment import INACTIVE_STATES
+from .perf_log import track_performance
+
+_logger = logging.getLogger(__name__)
+
+
+def _week_start(day):
+    return day - timedelta(days=day.weekday())
+
+
+def _merge_intervals(intervals):
+    """Merge sorted (start, stop) intervals into disjoint ones"""
+    merged = []
+    for start, stop in intervals:
+        if merged and start <= merged[-1][1]:
+            if stop > merged[-1][1]:
+                merged[-1] = (merged[-1][0], stop)
+        else:
+            merged.append((start, stop))
+    return merged
+
+
+def _intersect_intervals(left, right):
+    """Intersection of two sorted lists of disjoint intervals, in one sweep"""
+    result = []
+    i = j = 0
+    while i < len(left) and j < len(right):
+        start = max(left[i][0], right[j][0])
+        stop = min(left[i][1], right[j][1])
+        if start < stop:
+            result.append((start, stop))
+        if left[i][1] < right[j][1]:
+            i += 1
+        else:
+            j += 1
+    return result
+
+
+def _hours_by_day(intervals, tz):
+    """Sum naive UTC intervals into {local date: hours}, splitting at local midnight"""
+    hours = defaultdict(float)
+    for start, stop in intervals:
+        local_start = pytz.utc.localize(start).astimezone(tz)
+        local_stop = pytz.utc.localize(stop).astimezone(tz)
+        day = local_start.date()
+        while day <= local_stop.date():
+            day_start = max(local_start, tz.localize(datetime.combine(day, dt_time.min)))
+            day_stop = min(local_stop, tz.localize(datetime.combine(day + timedelta(days=1), dt_time.min)))
+            if day_stop > day_start:
+                hours[day] += (day_stop - day_start).total_seconds() / 3600
+            day += timedelta(days=1)
+    return hours
+
+
+class ClinicDoctorCapacity(models.Model):
+    _name = 'clinic.doctor.capacity'
+    _description = 'Doctor Daily Capacity'
+    _order = 'date, doctor_id'
+    
+    # Rows are a cache filled one ISO week per doctor at a time: every day of a
+    # computed week has a row, so a missing row means the week must be computed
+    date = fields.Date(string='Date', required=True, readonly=True)
+    week_start = fields.Date(string='Week', required=True, readonly=True, index=True)
+    doctor_id = fields.Many2one('hr.employee', string='Doctor', required=True, readonly=True,
+                                ondelete='cascade', index=True)
+    medical_specialization = fields.Selection(
+        selection=lambda self: self.env['hr.employee']._fields['medical_specialization'].selection,
+        string='Specialization', readonly=True)
+    company_id = fields.Many2one('res.company', string='Company', readonly=True)
+    available_hours = fields.Float(string='Available Hours', readonly=True)
+    booked_hours = fields.Float(string='Booked Hours', readonly=True)
+    overbooked_hours = fields.Float(string='Booked Outside Hours', readonly=True,
+                                    help='Booked time falling outside the working schedule')
+    free_hours = fields.Float(string='Free Hours', readonly=True)
+    utilization = fields.Float(string='Utilization (%)', readonly=True, aggregator='avg')
+    
+    _sql_constraints = [
+        ('doctor_date_uniq', 'unique(doctor_id, date)', 'Capacity is computed once per doctor and day.'),
+    ]
+    
+    @api.model
+    def _ensure_capacity(self, doctors, date_from, date_to):
+        """Compute the weeks of ``doctors`` between two dates that are not cached yet"""
+        weeks = []
+        week = _week_start(date_from)
+        while week <= date_to:
+            weeks.append(week)
+            week += timedelta(days=7)
+        if not doctors or not weeks:
+            return
+        self.env.cr.execute("""
+            SELECT DISTINCT doctor_id, week_start
+              FROM clinic_doctor_capacity
+             WHERE doctor_id = ANY(%s) AND week_start = ANY(%s)
+        """, [doctors.ids, weeks])
+        cached = set(self.env.cr.fetchall())
+        missing_by_week = defaultdict(list)
+        for week in weeks:
+            for doctor_id in doctors.ids:
+                if (doctor_id, week) not in cached:
+                    missing_by_week[week].append(doctor_id)
+        for week, doctor_ids in missing_by_week.items():
+            self._compute_week(self.env['hr.employee'].browse(doctor_ids), week)
+    
+    @api.model
+    def _compute_week(self, doctors, week):
+        """Compute and store the seven daily rows of ``week`` for each doctor"""
+        doctors = doctors.sudo()
+        days = [week + timedelta(days=offset) for offset in range(7)]
+        # Fetch one day of margin on each side, as local days do not align with UTC
+        start = datetime.combine(week - timedelta(days=1), dt_time.min)
+        stop = datetime.combine(week + timedelta(days=8), dt_time.min)
+        work_intervals = doctors._get_work_intervals(start, stop)
+    
+        self.env['clinic.appointment'].flush_model(['doctor_id', 'date', 'end_date', 'state'])
+        self.env.cr.execute("""
+            SELECT doctor_id, date, end_date
+              FROM clinic_appointment
+             WHERE doctor_id = ANY(%s)
+               AND state NOT IN %s
+               AND date < %s AND end_date > %s
+          ORDER BY doctor_id, date
+        """, [doctors.ids, INACTIVE_STATES, stop, start])
+        booked_intervals = defaultdict(list)
+        for doctor_id, begin, end in self.env.cr.fetchall():
+            booked_intervals[doctor_id].append((begin, end))
+    
+        rows = []
+        for doctor in doctors:
+            tz = pytz.timezone(doctor.tz or 'UTC')
+            working = _merge_intervals(sorted(work_intervals[doctor.id]))
+            booked = _merge_intervals(booked_intervals[doctor.id])
+            available_by_day = _hours_by_day(working, tz)
+            booked_by_day = _hours_by_day(booked, tz)
+            within_by_day = _hours_by_day(_intersect_intervals(working, booked), tz)
+            for day in days:
+                available = available_by_day.get(day, 0.0)
+                booked_hours = booked_by_day.get(day, 0.0)
+                within = within_by_day.get(day, 0.0)
+                rows.append((
+                    day, week, doctor.id, doctor.medical_specialization or None, doctor.company_id.id or None,
+                    available, booked_hours, booked_hours - within, max(available - within, 0.0),
+                    100.0 * booked_hours / available if available else 0.0,
+                ))
+    
+        # Readers may fill the same week concurrently: the last one wins instead of
+        # failing on the unique constraint
+        self.env.cr.execute("""
+            INSERT INTO clinic_doctor_capacity (
+                date, week_start, doctor_id, medical_specialization, company_id,
+                available_hours, booked_hours, overbooked_hours, free_hours, utilization,
+                create_uid, create_date, write_uid, write_date)
+            SELECT v.*, %s, now() AT TIME ZONE 'UTC', %s, now() AT TIME ZONE 'UTC'
+              FROM unnest(%s::date[], %s::date[], %s::int[], %s::varchar[], %s::int[],
+                          %s::float8[], %s::float8[], %s::float8[], %s::float8[], %s::float8[]) AS v
+            ON CONFLICT (doctor_id, date) DO UPDATE
+               SET week_start = EXCLUDED.week_start,
+                   medical_specialization = EXCLUDED.medical_specialization,
+                   company_id = EXCLUDED.company_id,
+                   available_hours = EXCLUDED.available_hours,
+                   booked_hours = EXCLUDED.booked_hours,
+                   overbooked_hours = EXCLUDED.overbooked_hours,
+                   free_hours = EXCLUDED.free_hours,
+                   utilization = EXCLUDED.utilization,
+                   write_uid = EXCLUDED.write_uid,
+                   write_date = EXCLUDED.write_date
+        """, [self.env.uid, self.env.uid, *(list(column) for column in zip(*rows))])
+        self.invalidate_model()
+    
+    @api.model
+    def _invalidate_capacity(self, doctor_weeks):
+        """Drop the cached weeks given as (doctor_id, week_start) pairs"""
+        doctor_weeks = list(doctor_weeks)
+        if not doctor_weeks:
+            return
+        self.env.cr.execute("""
+            DELETE FROM clinic_doctor_capacity c
+             USING unnest(%s::int[], %s::date[]) AS v(doctor_id, week_start)
+             WHERE c.doctor_id = v.doctor_id AND c.week_start = v.week_start
+        """, [list(column) for column in zip(*doctor_weeks)])
+        self.invalidate_model()
+    
+    @api.model
+    @track_performance
+    def _cron_refresh_capacity(self, days=90, batch_size=100):
+        """Cron job to recompute doctor capacity over the coming days
+
+        Appointment changes drop the weeks they touch, but working schedules
+        and leaves can change too: the whole horizon is rebuilt nightly.
+        """
+        started = time.perf_counter()
+        today = fields.Date.context_today(self)
+        doctors = self.env['hr.employee'].search([('is_medical_professional', '=', True)])
+        self.env.cr.execute("DELETE FROM clinic_doctor_capacity WHERE week_start >= %s", [_week_start(today)])
+        self.invalidate_model()
+        for ids in split_every(batch_size, doctors.ids):
+            self._ensure_capacity(self.env['hr.employee'].browse(ids), today, today + timedelta(days=days))
+        _logger.info("Doctor capacity: %d doctor(s) over %d days refreshed in %.2fs",
+                     len(doctors), days, time.perf_counter() - started)
+    
+    @api.model
+    @track_performance
+    def action_open_capacity(self, days=90):
+        """Fill the coming ``days`` for all doctors and open the capacity analysis"""
+        today = fields.Date.context_today(self)
+        date_to = today + timedelta(days=days)
+        doctors = self.env['hr.employee'].search([('is_medical_professional', '=', True)])
+        self._ensure_capacity(doctors, today, date_to)
+        action = self.env['ir.actions.act_window']._for_xml_id('medical_clinic.action_clinic_doctor_capacity')
+        action['domain'] = [('date', '>=', today), ('date', '<=', date_to)]
+        return action
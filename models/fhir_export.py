@@ -0,0 +1,223 @@
+import json
+import logging
+import re
+import time
+
+from odoo import models, api
+from odoo.tools import split_every
+
+from .perf_log import track_performance
+
+_logger = logging.getLogger(__name__)
+
+TREATMENT_STATUS = {'draft': 'in-progress', 'done': 'finished', 'cancelled': 'cancelled'}
+LAB_TEST_STATUS = {'requested': 'active', 'in_progress': 'active', 'done': 'completed'}
+# Times per day of the prescription frequencies
+PRESCRIPTION_FREQUENCY = {'od': 1, 'bd': 2, 'tds': 3, 'qds': 4}
+
+
+def _fhir_datetime(value):
+    # Stored datetimes are naive UTC
+    return value.isoformat() + 'Z' if value else None
+
+
+def _fhir_date(value):
+    return value.isoformat() if value else None
+
+
+def _fhir_id(code):
+    # Record codes such as PAT/2024/00001 are not valid resource ids
+    return re.sub(r'[^A-Za-z0-9.-]', '-', code)[:64]
+
+
+def _reference(resource_type, key):
+    return {'reference': '%s/%s' % (resource_type, key)}
+
+
+def _compact(resource):
+    """Drop empty elements, which FHIR does not allow"""
+    return {key: value for key, value in resource.items() if value not in (None, False, '', [], {})}
+
+
+class ClinicPatient(models.Model):
+    _inherit = 'clinic.patient'
+    
+    @track_performance
+    def export_fhir_ndjson(self, stream, batch_size=1000):
+        """Write the chart of the patients as FHIR resources to a binary ``stream``,
+        one JSON resource per line.
+
+        Patients are processed ``batch_size`` at a time: their treatments,
+        diagnoses, prescriptions, lab tests and dental procedures are fetched
+        with one query per model, and the cache is emptied between chunks so
+        memory stays flat whatever the number of patients.
+        """
+        started = time.perf_counter()
+        patients = resources = 0
+        for ids in split_every(batch_size, self.ids):
+            for resource in self.browse(ids)._get_fhir_resources():
+                stream.write(json.dumps(resource, separators=(',', ':')).encode())
+                stream.write(b'\n')
+                resources += 1
+            patients += len(ids)
+            self.env.invalidate_all()
+        elapsed = time.perf_counter() - started
+        _logger.info("FHIR export: %d patient(s), %d resource(s) in %.2fs (%.1f patients/s)",
+                     patients, resources, elapsed, patients / elapsed if elapsed else 0.0)
+        return {'patients': patients, 'resources': resources, 'duration': elapsed}
+    
+    def _get_fhir_resources(self):
+        """Yield the FHIR resources of one chunk of patients"""
+        patients = self.read([
+            'patient_code', 'first_name', 'last_name', 'gender', 'date_of_birth', 'phone', 'mobile',
+            'email', 'street', 'street2', 'city', 'state_id', 'country_id', 'zip', 'active', 'state',
+        ])
+        codes = {patient['id']: _fhir_id(patient['patient_code']) for patient in patients}
+        for patient in patients:
+            yield self._prepare_fhir_patient(patient)
+        
+        treatments = self.env['clinic.treatment'].with_context(active_test=False).search_read([('patient_id', 'in', self.ids)], [
+            'treatment_code', 'patient_id', 'doctor_id', 'date', 'state', 'treatment_type', 'chief_complaint',
+        ], order='patient_id, date')
+        encounters = {}
+        for treatment in treatments:
+            encounters[treatment['id']] = (codes[treatment['patient_id'][0]], _fhir_id(treatment['treatment_code']))
+            yield self._prepare_fhir_encounter(treatment, codes[treatment['patient_id'][0]])
+        if not treatments:
+            return
+        treatment_ids = list(encounters)
+        
+        for diagnosis in self.env['clinic.diagnosis'].search_read(
+                [('treatment_id', 'in', treatment_ids)], ['treatment_id', 'diagnosis', 'icd_code', 'notes']):
+            yield self._prepare_fhir_condition(diagnosis, *encounters[diagnosis['treatment_id'][0]])
+        
+        for prescription in self.env['clinic.prescription'].search_read(
+                [('treatment_id', 'in', treatment_ids)],
+                ['treatment_id', 'medicine_id', 'dosage', 'frequency', 'duration', 'quantity', 'instructions']):
+            yield self._prepare_fhir_medication_request(prescription, *encounters[prescription['treatment_id'][0]])
+        
+        for lab_test in self.env['clinic.lab.test'].search_read(
+                [('treatment_id', 'in', treatment_ids)],
+                ['treatment_id', 'test_type', 'test_name', 'state', 'notes', 'result']):
+            yield self._prepare_fhir_service_request(lab_test, *encounters[lab_test['treatment_id'][0]])
+        
+        for procedure in self.env['clinic.dental.procedure'].search_read(
+                [('treatment_id', 'in', treatment_ids)],
+                ['treatment_id', 'tooth_id', 'date', 'procedure_type', 'description', 'doctor_id', 'surfaces']):
+            yield self._prepare_fhir_procedure(procedure, *encounters[procedure['treatment_id'][0]])
+    
+    @api.model
+    def _prepare_fhir_patient(self, patient):
+        return _compact({
+            'resourceType': 'Patient',
+            'id': _fhir_id(patient['patient_code']),
+            'identifier': [{'system': 'urn:medical_clinic:patient', 'value': patient['patient_code']}],
+            'active': patient['active'] and patient['state'] == 'active',
+            'name': [{'family': patient['last_name'], 'given': [patient['first_name']]}],
+            'gender': patient['gender'] if patient['gender'] in ('male', 'female', 'other') else 'unknown',
+            'birthDate': _fhir_date(patient['date_of_birth']),
+            'deceasedBoolean': patient['state'] == 'deceased' or None,
+            'telecom': [
+                _compact({'system': system, 'value': patient[field], 'use': use})
+                for field, system, use in (('phone', 'phone', 'home'), ('mobile', 'phone', 'mobile'),
+                                           ('email', 'email', None))
+                if patient[field]
+            ],
+            'address': [_compact({
+                'line': [line for line in (patient['street'], patient['street2']) if line],
+                'city': patient['city'],
+                'state': patient['state_id'] and patient['state_id'][1],
+                'postalCode': patient['zip'],
+                'country': patient['country_id'] and patient['country_id'][1],
+            })] if patient['street'] or patient['city'] or patient['zip'] else None,
+        })
+    
+    @api.model
+    def _prepare_fhir_encounter(self, treatment, patient_code):
+        return _compact({
+            'resourceType': 'Encounter',
+            'id': _fhir_id(treatment['treatment_code']),
+            'identifier': [{'system': 'urn:medical_clinic:treatment', 'value': treatment['treatment_code']}],
+            'status': TREATMENT_STATUS.get(treatment['state'], 'unknown'),
+            'class': {'system': 'http://terminology.hl7.org/CodeSystem/v3-ActCode',
+                      'code': 'EMER' if treatment['treatment_type'] == 'emergency' else 'AMB'},
+            'type': [{'text': treatment['treatment_type']}] if treatment['treatment_type'] else None,
+            'subject': _reference('Patient', patient_code),
+            'participant': [{'individual': {'display': treatment['doctor_id'][1]}}] if treatment['doctor_id'] else None,
+            'period': {'start': _fhir_datetime(treatment['date'])},
+            'reasonCode': [{'text': treatment['chief_complaint']}] if treatment['chief_complaint'] else None,
+        })
+    
+    @api.model
+    def _prepare_fhir_condition(self, diagnosis, patient_code, encounter_code):
+        code = {'text': diagnosis['diagnosis']}
+        if diagnosis['icd_code']:
+            code['coding'] = [{'system': 'http://hl7.org/fhir/sid/icd-10', 'code': diagnosis['icd_code']}]
+        return _compact({
+            'resourceType': 'Condition',
+            'id': '%s-condition-%s' % (encounter_code, diagnosis['id']),
+            'code': code,
+            'subject': _reference('Patient', patient_code),
+            'encounter': _reference('Encounter', encounter_code),
+            'note': [{'text': diagnosis['notes']}] if diagnosis['notes'] else None,
+        })
+    
+    @api.model
+    def _prepare_fhir_medication_request(self, prescription, patient_code, encounter_code):
+        dosage = {'text': prescription['dosage'], 'patientInstruction': prescription['instructions'] or None}
+        if prescription['frequency'] in PRESCRIPTION_FREQUENCY:
+            dosage['timing'] = {'repeat': {'frequency': PRESCRIPTION_FREQUENCY[prescription['frequency']],
+                                           'period': 1, 'periodUnit': 'd'}}
+        elif prescription['frequency'] == 'sos':
+            dosage['asNeededBoolean'] = True
+        return _compact({
+            'resourceType': 'MedicationRequest',
+            'id': '%s-medication-%s' % (encounter_code, prescription['id']),
+            'status': 'active',
+            'intent': 'order',
+            'medicationCodeableConcept': {'text': prescription['medicine_id'][1]},
+            'subject': _reference('Patient', patient_code),
+            'encounter': _reference('Encounter', encounter_code),
+            'dosageInstruction': [_compact(dosage)],
+            'dispenseRequest': {
+                'quantity': {'value': prescription['quantity']},
+                'expectedSupplyDuration': {'value': prescription['duration'], 'unit': 'days',
+                                           'system': 'http://unitsofmeasure.org', 'code': 'd'},
+            },
+        })
+    
+    @api.model
+    def _prepare_fhir_service_request(self, lab_test, patient_code, encounter_code):
+        return _compact({
+            'resourceType': 'ServiceRequest',
+            'id': '%s-lab-%s' % (encounter_code, lab_test['id']),
+            'status': LAB_TEST_STATUS.get(lab_test['state'], 'unknown'),
+            'intent': 'order',
+            'category': [{'text': lab_test['test_type']}],
+            'code': {'text': lab_test['test_name']},
+            'subject': _reference('Patient', patient_code),
+            'encounter': _reference('Encounter', encounter_code),
+            'note': [{'text': text} for text in (lab_test['notes'], lab_test['result']) if text],
+        })
+    
+    @api.model
+    def _prepare_fhir_procedure(self, procedure, patient_code, encounter_code):
+        return _compact({
+            'resourceType': 'Procedure',
+            'id': '%s-dental-%s' % (encounter_code, procedure['id']),
+            'status': 'completed',
+            'code': {'text': procedure['procedure_type']},
+            'subject': _reference('Patient', patient_code),
+            'encounter': _reference('Encounter', encounter_code),
+            'performedDateTime': _fhir_datetime(procedure['date']),
+            'performer': [{'actor': {'display': procedure['doctor_id'][1]}}] if procedure['doctor_id'] else None,
+            'bodySite': [{'text': procedure['tooth_id'][1]}] if procedure['tooth_id'] else None,
+            'note': [{'text': text} for text in (procedure['description'], procedure['surfaces']) if text],
+        })
+    
+    def action_export_fhir(self):
+        return {
+            'type': 'ir.actions.act_url',
+            'url': '/medical_clinic/export/fhir?ids=%s' % ','.join(map(str, self.ids)),
+            'target': 'self',
+        }
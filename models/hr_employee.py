@@ -1,5 +1,10 @@
+import pytz
+from collections import defaultdict
+
 from odoo import models, fields
 
+from .perf_log import track_performance
+
 class HrEmployee(models.Model):
     _inherit = 'hr.employee'
     
@@ -23,3 +28,40 @@ class HrEmployee(models.Model):
     
     # Add appointment relationship
     appointment_ids = fields.One2many('clinic.appointment', 'doctor_id', string='Appointments')
+    
+    def _get_work_intervals(self, start, stop):
+        """Return {employee_id: [(start, stop), ...]} working intervals between two
+        naive UTC datetimes, computed with one batch call per resource calendar."""
+        start_utc = pytz.utc.localize(start)
+        stop_utc = pytz.utc.localize(stop)
+        by_calendar = defaultdict(lambda: self.browse())
+        for employee in self:
+            by_calendar[employee.resource_calendar_id or employee.company_id.resource_calendar_id] |= employee
+        
+        result = {}
+        for calendar, employees in by_calendar.items():
+            if not calendar:
+                result.update(dict.fromkeys(employees.ids, []))
+                continue
+            intervals = calendar._work_intervals_batch(start_utc, stop_utc, resources=employees.resource_id)
+            for employee in employees:
+                result[employee.id] = [
+                    (begin.astimezone(pytz.utc).replace(tzinfo=None), end.astimezone(pytz.utc).replace(tzinfo=None))
+                    for begin, end, _records in intervals[employee.resource_id.id]
+                ]
+        return result
+    
+    @track_performance
+    def get_capacity(self, date_from, date_to):
+        """Return booked against available hours per doctor and day between two dates,
+        computing the weeks that are not cached yet"""
+        date_from = fields.Date.to_date(date_from)
+        date_to = fields.Date.to_date(date_to)
+        Capacity = self.env['clinic.doctor.capacity']
+        Capacity._ensure_capacity(self, date_from, date_to)
+        return Capacity.search_read([
+            ('doctor_id', 'in', self.ids),
+            ('date', '>=', date_from),
+            ('date', '<=', date_to),
+        ], ['doctor_id', 'date', 'available_hours', 'booked_hours', 'overbooked_hours',
+            'free_hours', 'utilization'], load=None)
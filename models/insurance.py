@@ -1,12 +1,35 @@
-from odoo import models, fields, api, _
+import logging
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from odoo import models, fields, api, tools, _
 from odoo.exceptions import ValidationError
+from odoo.osv import expression
+from odoo.tools import split_every
+
+from .claim_transport import RateLimiter, get_claim_transport
+from .perf_log import track_performance
+
+_logger = logging.getLogger(__name__)
+
+
+def _fetch_claim_status(transport, limiter, claim_numbers):
+    # Runs in a worker thread: no ORM access
+    limiter.wait()
+    return transport.fetch_status(claim_numbers)
 
 class ClinicInsurance(models.Model):
     _name = 'clinic.insurance'
     _description = 'Patient Insurance'
     _rec_name = 'display_name'
     
-    patient_id = fields.Many2one('clinic.patient', string='Patient', required=True, ondelete='cascade')
+    patient_id = fields.Many2one('clinic.patient', string='Patient', required=True, ondelete='cascade',
+                                 index=True)
     insurance_company_id = fields.Many2one('res.partner', string='Insurance Company',
                                          domain=[('is_insurance_company', '=', True)], required=True)
     policy_number = fields.Char(string='Policy Number', required=True)
@@ -40,9 +63,9 @@ class ClinicInsurance(models.Model):
     
     # Claims
     claim_ids = fields.One2many('clinic.insurance.claim', 'insurance_id', string='Claims')
-    total_claimed = fields.Float(string='Total Claimed', compute='_compute_claim_totals')
-    total_approved = fields.Float(string='Total Approved', compute='_compute_claim_totals')
-    remaining_coverage = fields.Float(string='Remaining Coverage', compute='_compute_claim_totals')
+    total_claimed = fields.Float(string='Total Claimed', compute='_compute_claim_totals', store=True)
+    total_approved = fields.Float(string='Total Approved', compute='_compute_claim_totals', store=True)
+    remaining_coverage = fields.Float(string='Remaining Coverage', compute='_compute_claim_totals', store=True)
     
     display_name = fields.Char(string='Display Name', compute='_compute_display_name', store=True)
     company_id = fields.Many2one('res.company', string='Company', required=True,
@@ -65,25 +88,107 @@ class ClinicInsurance(models.Model):
             else:
                 rec.is_active = False
     
-    @api.depends('claim_ids.amount_claimed', 'claim_ids.amount_approved', 'claim_ids.state')
+    @api.model
+    @track_performance
+    def _cron_refresh_is_active(self, batch_size=1000):
+        """Cron job to recompute is_active on the policies whose stored value is out of date,
+        i.e. policies starting or expiring since the last run"""
+        today = fields.Date.today()
+        stale = self.search(expression.OR([
+            [('is_active', '=', False), ('start_date', '<=', today),
+             '|', ('end_date', '=', False), ('end_date', '>=', today)],
+            [('is_active', '=', True), '|', ('start_date', '>', today), ('end_date', '<', today)],
+        ]))
+        for ids in split_every(batch_size, stale.ids):
+            policies = self.browse(ids)
+            self.env.add_to_compute(self._fields['is_active'], policies)
+            policies.flush_recordset(['is_active'])
+        _logger.info("Insurance validity refresh: %d policies updated", len(stale))
+    
+    @api.depends('max_coverage', 'claim_ids.amount_claimed', 'claim_ids.amount_approved', 'claim_ids.state')
     def _compute_claim_totals(self):
+        # Only policies whose claims changed are recomputed, from one grouped query
+        totals = {}
+        for insurance, state, amount_claimed, amount_approved in self.env['clinic.insurance.claim']._read_group(
+                [('insurance_id', 'in', self.ids)], ['insurance_id', 'state'],
+                ['amount_claimed:sum', 'amount_approved:sum']):
+            claimed, approved = totals.get(insurance, (0.0, 0.0))
+            totals[insurance] = (claimed + amount_claimed,
+                                 approved + (amount_approved if state == 'approved' else 0.0))
         for rec in self:
-            approved_claims = rec.claim_ids.filtered(lambda c: c.state == 'approved')
-            rec.total_claimed = sum(rec.claim_ids.mapped('amount_claimed'))
-            rec.total_approved = sum(approved_claims.mapped('amount_approved'))
+            rec.total_claimed, rec.total_approved = totals.get(rec._origin, (0.0, 0.0))
             rec.remaining_coverage = rec.max_coverage - rec.total_approved if rec.max_coverage else 0
     
-    @api.constrains('is_primary')
-    def _check_primary_insurance(self):
-        for rec in self:
-            if rec.is_primary:
-                other_primary = self.search([
-                    ('patient_id', '=', rec.patient_id.id),
-                    ('is_primary', '=', True),
-                    ('id', '!=', rec.id)
-                ])
-                if other_primary:
-                    other_primary.is_primary = False
+    def init(self):
+        # Keep the latest primary policy per patient before enforcing a single one
+        self.env.cr.execute("""
+            UPDATE clinic_insurance
+               SET is_primary = false
+             WHERE is_primary
+               AND id NOT IN (SELECT max(id) FROM clinic_insurance WHERE is_primary GROUP BY patient_id)
+         RETURNING patient_id
+        """)
+        patients = self.env['clinic.patient'].browse({patient_id for patient_id, in self.env.cr.fetchall()})
+        if patients:
+            # Their stored primary policy may be one that was just demoted
+            self.invalidate_model(['is_primary'])
+            self.env.add_to_compute(patients._fields['primary_insurance_id'], patients)
+            patients.flush_recordset(['primary_insurance_id'])
+        self.env.cr.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS clinic_insurance_primary_patient_uniq
+                ON clinic_insurance (patient_id) WHERE is_primary
+        """)
+    
+    @api.model_create_multi
+    @track_performance
+    def create(self, vals_list):
+        # The last primary policy of each patient in the batch wins
+        default_primary = self.default_get(['is_primary']).get('is_primary', False)
+        primary_vals = {}
+        for vals in vals_list:
+            if vals.get('is_primary', default_primary) and vals.get('patient_id'):
+                if vals['patient_id'] in primary_vals:
+                    primary_vals[vals['patient_id']]['is_primary'] = False
+                vals['is_primary'] = True
+                primary_vals[vals['patient_id']] = vals
+        self._demote_primary_insurances(list(primary_vals))
+        return super().create(vals_list)
+    
+    @track_performance
+    def write(self, vals):
+        if vals.get('is_primary') or (vals.get('patient_id') and vals.get('is_primary', True)):
+            primaries = self if vals.get('is_primary') else self.filtered('is_primary')
+            # Among the written policies, the latest one per patient stays primary
+            winners = {}
+            for rec in primaries.sorted('id'):
+                winners[vals.get('patient_id') or rec.patient_id.id] = rec.id
+            self._demote_primary_insurances(list(winners), exclude_ids=list(winners.values()))
+            demoted = primaries - self.browse(list(winners.values()))
+            if demoted:
+                super(ClinicInsurance, demoted).write(dict(vals, is_primary=False))
+                return super(ClinicInsurance, self - demoted).write(vals)
+        return super().write(vals)
+    
+    @api.model
+    def _demote_primary_insurances(self, patient_ids, exclude_ids=()):
+        """Clear the primary flag of the patients' policies in one SQL update"""
+        if not patient_ids:
+            return
+        self.flush_model(['patient_id', 'is_primary'])
+        self.env.cr.execute("""
+            UPDATE clinic_insurance
+               SET is_primary = false,
+                   write_uid = %s,
+                   write_date = (now() at time zone 'UTC')
+             WHERE is_primary
+               AND patient_id = ANY(%s)
+               AND id != ALL(%s)
+         RETURNING id
+        """, [self.env.uid, list(patient_ids), list(exclude_ids)])
+        demoted = self.browse([row[0] for row in self.env.cr.fetchall()])
+        if demoted:
+            demoted.invalidate_recordset(['is_primary', 'write_uid', 'write_date'])
+            demoted.modified(['is_primary'])
 
 
 class ClinicInsuranceClaim(models.Model):
@@ -95,11 +200,11 @@ class ClinicInsuranceClaim(models.Model):
     
     claim_number = fields.Char(string='Claim Number', required=True, copy=False,
                               default='New', readonly=True)
-    patient_id = fields.Many2one('clinic.patient', string='Patient', required=True)
-    insurance_id = fields.Many2one('clinic.insurance', string='Insurance', required=True,
+    patient_id = fields.Many2one('clinic.patient', string='Patient', required=True, index=True)
+    insurance_id = fields.Many2one('clinic.insurance', string='Insurance', required=True, index=True,
                                   domain="[('patient_id', '=', patient_id), ('is_active', '=', True)]")
-    treatment_id = fields.Many2one('clinic.treatment', string='Treatment')
-    invoice_id = fields.Many2one('account.move', string='Invoice')
+    treatment_id = fields.Many2one('clinic.treatment', string='Treatment', index='btree_not_null')
+    invoice_id = fields.Many2one('account.move', string='Invoice', index='btree_not_null')
     
     # Claim Details
     claim_date = fields.Date(string='Claim Date', required=True, default=fields.Date.today)
@@ -114,6 +219,10 @@ class ClinicInsuranceClaim(models.Model):
     patient_responsibility = fields.Float(string='Patient Responsibility',
                                         compute='_compute_patient_responsibility')
     
+    # Submission batch
+    batch_id = fields.Many2one('clinic.insurance.claim.batch', string='Submission Batch',
+                               readonly=True, copy=False)
+    
     # Status
     state = fields.Selection([
         ('draft', 'Draft'),
@@ -123,12 +232,13 @@ class ClinicInsuranceClaim(models.Model):
         ('partial', 'Partially Approved'),
         ('rejected', 'Rejected'),
         ('paid', 'Paid')
-    ], default='draft', tracking=True)
+    ], default='draft', tracking=True, index=True)
     
     # Dates
     submission_date = fields.Date(string='Submission Date')
     approval_date = fields.Date(string='Approval Date')
     payment_date = fields.Date(string='Payment Date')
+    last_status_check = fields.Datetime(string='Last Status Check', readonly=True, copy=False)
     
     # Additional Information
     rejection_reason = fields.Text(string='Rejection Reason')
@@ -155,22 +265,27 @@ class ClinicInsuranceClaim(models.Model):
                 rec.patient_responsibility = rec.amount_claimed
     
     @api.model_create_multi
+    @track_performance
     def create(self, vals_list):
         for vals in vals_list:
             if vals.get('claim_number', 'New') == 'New':
                 vals['claim_number'] = self.env['ir.sequence'].next_by_code('clinic.insurance.claim') or 'New'
+        self.env['clinic.dashboard']._invalidate_cache()
         return super().create(vals_list)
     
+    @track_performance
+    def write(self, vals):
+        self.env['clinic.dashboard']._invalidate_cache()
+        return super().write(vals)
+    
+    @track_performance
     def action_submit(self):
-        self.ensure_one()
-        if self.state == 'draft':
-            self.write({
-                'state': 'submitted',
-                'submission_date': fields.Date.today()
-            })
-            # Send claim to insurance company
-            self._send_claim_to_insurance()
+        claims = self.filtered(lambda c: c.state == 'draft')
+        if claims:
+            # Send claims to insurance companies
+            claims._submit_in_batches()
     
+    @track_performance
     def action_approve(self):
         self.ensure_one()
         if self.state in ['submitted', 'in_review']:
@@ -189,6 +304,7 @@ class ClinicInsuranceClaim(models.Model):
             'context': {'default_claim_id': self.id}
         }
     
+    @track_performance
     def action_mark_paid(self):
         self.ensure_one()
         if self.state == 'approved':
@@ -200,18 +316,240 @@ class ClinicInsuranceClaim(models.Model):
             # Create payment in accounting
             self._create_payment_entry()
     
-    def _send_claim_to_insurance(self):
-        # Integration with insurance company API
-        pass
+    @api.model
+    def _get_claim_transport(self):
+        """Return (name, transport) configured through system parameters"""
+        params = self.env['ir.config_parameter'].sudo()
+        name = params.get_param('medical_clinic.claim_transport', 'file')
+        directory = params.get_param('medical_clinic.claim_drop_directory') or os.path.join(
+            tools.config['data_dir'], 'medical_clinic_claims', self.env.cr.dbname)
+        return name, get_claim_transport(name, {
+            'directory': directory,
+            'url': params.get_param('medical_clinic.claim_payer_url'),
+        })
+    
+    @api.model
+    def _get_claim_workers(self):
+        return int(self.env['ir.config_parameter'].sudo().get_param('medical_clinic.claim_workers', 4))
+    
+    def _submit_in_batches(self):
+        """Send the claims as one X12 837 batch per insurance company.
+
+        Batches are delivered concurrently by the configured transport; the claims
+        of each delivered batch are then flagged with a single write.
+        """
+        claims_by_payer = defaultdict(lambda: self.browse())
+        for claim in self:
+            claims_by_payer[(claim.insurance_id.insurance_company_id, claim.company_id)] |= claim
+        
+        transport_name, transport = self._get_claim_transport()
+        groups = list(claims_by_payer.items())
+        batches = self.env['clinic.insurance.claim.batch'].create([{
+            'insurance_company_id': payer.id,
+            'company_id': company.id,
+            'transport': transport_name,
+        } for (payer, company), _claims in groups])
+        payloads = [batch._build_x12_837(claims) for batch, (_key, claims) in zip(batches, groups)]
+        
+        # Only plain data crosses into the worker threads
+        with ThreadPoolExecutor(max_workers=self._get_claim_workers()) as executor:
+            futures = [executor.submit(transport.send_batch, batch.name, payload)
+                       for batch, payload in zip(batches, payloads)]
+        
+        today = fields.Date.today()
+        for batch, (_key, claims), future in zip(batches, groups, futures):
+            try:
+                reference = future.result()
+            except Exception as e:
+                _logger.warning("Claim batch %s could not be sent: %s", batch.name, e)
+                batch.write({'state': 'error', 'error_message': str(e)})
+                claims.write({'batch_id': batch.id})
+                continue
+            batch.write({'state': 'sent', 'reference': reference, 'sent_date': fields.Datetime.now()})
+            claims.write({
+                'state': 'submitted',
+                'submission_date': today,
+                'batch_id': batch.id,
+            })
+        return batches
+    
+    @api.model
+    @track_performance
+    def _cron_submit_draft_claims(self, batch_size=5000):
+        """Cron job to submit all draft claims, committing after each chunk"""
+        auto_commit = not getattr(threading.current_thread(), 'testing', False)
+        drafts = self.search([('state', '=', 'draft')], order='id')
+        for ids in split_every(batch_size, drafts.ids):
+            self.browse(ids)._submit_in_batches()
+            if auto_commit:
+                self.env.cr.commit()
     
     def _create_payment_entry(self):
         # Create journal entry for insurance payment
         pass
     
     @api.model
-    def check_claim_status(self):
-        """Cron job to check status of submitted claims"""
-        submitted_claims = self.search([('state', '=', 'submitted')])
-        for claim in submitted_claims:
-            # Check status with insurance company API
-            pass
+    @track_performance
+    def check_claim_status(self, page_size=2000):
+        """Cron job to check status of submitted claims
+
+        Claims are paged by id and each page is polled per payer concurrently, with
+        at most ``medical_clinic.claim_status_rate_limit`` requests per second and
+        payer. Polled claims are stamped and committed after each page; claims
+        stamped less than ``medical_clinic.claim_status_recheck_hours`` ago are
+        skipped, so an interrupted run resumes where it stopped.
+        """
+        params = self.env['ir.config_parameter'].sudo()
+        auto_commit = not getattr(threading.current_thread(), 'testing', False)
+        _transport_name, transport = self._get_claim_transport()
+        request_size = int(params.get_param('medical_clinic.claim_status_request_size', 100))
+        rate = float(params.get_param('medical_clinic.claim_status_rate_limit', 5))
+        recheck_hours = float(params.get_param('medical_clinic.claim_status_recheck_hours', 12))
+        limiters = defaultdict(lambda: RateLimiter(rate))
+        now = fields.Datetime.now()
+        domain = [
+            ('state', 'in', ('submitted', 'in_review')),
+            '|', ('last_status_check', '=', False),
+                 ('last_status_check', '<', now - timedelta(hours=recheck_hours)),
+        ]
+        
+        started = time.perf_counter()
+        polled = updated = 0
+        while True:
+            # Stamped claims leave the domain, so each search returns the next page
+            claims = self.search(domain, order='id', limit=page_size)
+            if not claims:
+                break
+            results = claims._poll_claim_status(transport, request_size, limiters)
+            updated += claims._apply_claim_status(results)
+            claims.write({'last_status_check': now})
+            polled += len(claims)
+            if auto_commit:
+                self.env.cr.commit()
+        elapsed = time.perf_counter() - started
+        _logger.info("Claim status check: %d polled, %d updated in %.2fs (%.1f claims/s)",
+                     polled, updated, elapsed, polled / elapsed if elapsed else 0.0)
+        return {'polled': polled, 'updated': updated, 'duration': elapsed}
+    
+    def _poll_claim_status(self, transport, request_size, limiters):
+        """Query the payers of the claims concurrently, in requests of ``request_size`` claims"""
+        numbers_by_payer = defaultdict(list)
+        for claim in self:
+            numbers_by_payer[claim.insurance_id.insurance_company_id.id].append(claim.claim_number)
+        
+        results = {}
+        with ThreadPoolExecutor(max_workers=self._get_claim_workers()) as executor:
+            futures = [
+                executor.submit(_fetch_claim_status, transport, limiters[payer_id], list(numbers))
+                for payer_id, payer_numbers in numbers_by_payer.items()
+                for numbers in split_every(request_size, payer_numbers)
+            ]
+        for future in futures:
+            try:
+                results.update(future.result())
+            except Exception as e:
+                _logger.warning("Claim status request failed: %s", e)
+        return results
+    
+    def _apply_claim_status(self, results):
+        """Apply payer answers, writing claims that receive the same values together"""
+        today = fields.Date.today()
+        claims_by_vals = defaultdict(lambda: self.browse())
+        for claim in self:
+            answer = results.get(claim.claim_number)
+            if not answer or answer.get('status') == claim.state:
+                continue
+            status = answer['status']
+            if status == 'in_review':
+                vals = {'state': 'in_review'}
+            elif status in ('approved', 'partial'):
+                amount = answer.get('amount_approved')
+                if amount is None:
+                    amount = claim.amount_claimed * answer.get('ratio', 1.0)
+                vals = {'state': status, 'approval_date': today, 'amount_approved': amount}
+            elif status == 'rejected':
+                vals = {'state': 'rejected', 'rejection_reason': answer.get('reason')}
+            else:
+                continue
+            claims_by_vals[tuple(sorted(vals.items()))] |= claim
+        for vals, claims in claims_by_vals.items():
+            claims.write(dict(vals))
+        return sum(len(claims) for claims in claims_by_vals.values())
+
+def _x12(value):
+    # Strip X12 delimiters from free text
+    return re.sub(r'[*~:^]', ' ', str(value or '')).strip()
+
+
+class ClinicInsuranceClaimBatch(models.Model):
+    _name = 'clinic.insurance.claim.batch'
+    _description = 'Insurance Claim Submission Batch'
+    _order = 'id desc'
+    
+    name = fields.Char(string='Batch Number', required=True, copy=False,
+                       default='New', readonly=True)
+    insurance_company_id = fields.Many2one('res.partner', string='Insurance Company', required=True,
+                                           readonly=True)
+    claim_ids = fields.One2many('clinic.insurance.claim', 'batch_id', string='Claims')
+    claim_count = fields.Integer(string='Claims', compute='_compute_claim_count')
+    
+    # Transmission
+    transport = fields.Char(string='Transport', readonly=True)
+    reference = fields.Char(string='Payer Reference', readonly=True)
+    sent_date = fields.Datetime(string='Sent On', readonly=True)
+    error_message = fields.Text(string='Error', readonly=True)
+    state = fields.Selection([
+        ('draft', 'Draft'),
+        ('sent', 'Sent'),
+        ('error', 'Error')
+    ], default='draft', readonly=True)
+    
+    company_id = fields.Many2one('res.company', string='Company', required=True,
+                                default=lambda self: self.env.company)
+    
+    def _compute_claim_count(self):
+        counts = dict(self.env['clinic.insurance.claim']._read_group(
+            [('batch_id', 'in', self.ids)], ['batch_id'], ['__count']))
+        for rec in self:
+            rec.claim_count = counts.get(rec._origin, 0)
+    
+    @api.model_create_multi
+    @track_performance
+    def create(self, vals_list):
+        for vals in vals_list:
+            if vals.get('name', 'New') == 'New':
+                vals['name'] = self.env['ir.sequence'].next_by_code('clinic.insurance.claim.batch') or 'New'
+        return super().create(vals_list)
+    
+    def _build_x12_837(self, claims):
+        """Serialize claims into an X12 837P-style interchange for this batch"""
+        self.ensure_one()
+        now = fields.Datetime.now()
+        control = '%09d' % self.id
+        sender = _x12(self.company_id.vat or self.company_id.name)[:15]
+        receiver = _x12(self.insurance_company_id.ref or self.insurance_company_id.name)[:15]
+        segments = [
+            "ST*837*0001*005010X222A1",
+            f"BHT*0019*00*{_x12(self.name)}*{now:%Y%m%d}*{now:%H%M}*CH",
+            f"NM1*41*2*{_x12(self.company_id.name)}*****46*{sender}",
+            f"NM1*40*2*{_x12(self.insurance_company_id.name)}*****46*{receiver}",
+        ]
+        for index, claim in enumerate(claims, start=1):
+            patient = claim.patient_id
+            segments += [
+                f"HL*{index}**22*0",
+                f"SBR*P*18*{_x12(claim.insurance_id.group_number)}******CI",
+                f"NM1*IL*1*{_x12(patient.last_name)}*{_x12(patient.first_name)}****MI*{_x12(claim.insurance_id.policy_number)}",
+                f"CLM*{_x12(claim.claim_number)}*{claim.amount_claimed:.2f}***11:B:1*Y*A*Y*Y",
+                f"DTP*472*D8*{claim.service_date:%Y%m%d}",
+            ]
+            codes = [_x12(code) for code in re.split(r'[\s,;]+', claim.diagnosis_codes or '') if code]
+            if codes:
+                segments.append('HI*' + '*'.join(f"ABK:{code}" for code in codes[:12]))
+        segments.append(f"SE*{len(segments) + 1}*0001")
+        envelope = [
+            f"ISA*00*{'':10}*00*{'':10}*ZZ*{sender:<15}*ZZ*{receiver:<15}*{now:%y%m%d}*{now:%H%M}*^*00501*{control}*0*P*:",
+            f"GS*HC*{sender}*{receiver}*{now:%Y%m%d}*{now:%H%M}*{self.id}*X*005010X222A1",
+        ]
+        trailer = [f"GE*1*{self.id}", f"IEA*1*{control}"]
+        return '~\n'.join(envelope + segments + trailer) + '~\n'
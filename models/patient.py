@@ -1,5 +1,27 @@
+import logging
+import re
+from collections import defaultdict
+
 from odoo import models, fields, api, _
+from odoo.osv import expression
+from odoo.tools import split_every
+from odoo.tools.sql import create_index, drop_index, make_index_name
 from dateutil.relativedelta import relativedelta
+import psycopg2
+
+from .perf_log import track_performance
+
+_logger = logging.getLogger(__name__)
+
+
+# Patient fields copied as-is to the related partner
+PARTNER_SYNC_FIELDS = ('phone', 'mobile', 'email', 'street', 'street2',
+                       'city', 'state_id', 'country_id', 'zip')
+
+
+def _phone_digits(value):
+    return re.sub(r'\D', '', value or '')
+
 
 class ClinicPatient(models.Model):
     _name = 'clinic.patient'
@@ -10,14 +32,15 @@ class ClinicPatient(models.Model):
     # Basic Information
     first_name = fields.Char(string='First Name', required=True, tracking=True)
     last_name = fields.Char(string='Last Name', required=True, tracking=True)
-    full_name = fields.Char(string='Full Name', compute='_compute_full_name', store=True)
+    full_name = fields.Char(string='Full Name', compute='_compute_full_name', store=True,
+                            index='trigram')
     patient_code = fields.Char(string='Patient Code', required=True, copy=False, 
-                               default='New', readonly=True)
+                               default='New', readonly=True, index='trigram')
     image = fields.Binary(string='Photo', attachment=True)
     
     # Demographics
     date_of_birth = fields.Date(string='Date of Birth', required=True)
-    age = fields.Integer(string='Age', compute='_compute_age')
+    age = fields.Integer(string='Age', compute='_compute_age', store=True)
     gender = fields.Selection([
         ('male', 'Male'),
         ('female', 'Female'),
@@ -32,8 +55,10 @@ class ClinicPatient(models.Model):
     
     # Contact Information
     phone = fields.Char(string='Phone', required=True)
+    phone_sanitized = fields.Char(string='Phone (digits)', compute='_compute_phone_sanitized',
+                                  store=True, index='trigram')
     mobile = fields.Char(string='Mobile')
-    email = fields.Char(string='Email')
+    email = fields.Char(string='Email', index='trigram')
     street = fields.Char(string='Street')
     street2 = fields.Char(string='Street2')
     city = fields.Char(string='City')
@@ -59,12 +84,17 @@ class ClinicPatient(models.Model):
                                           compute='_compute_primary_insurance', store=True)
     
     # Relationships
-    appointment_ids = fields.One2many('clinic.appointment', 'patient_id', string='Appointments')
-    treatment_ids = fields.One2many('clinic.treatment', 'patient_id', string='Treatments')
+    # Archived history stays part of the chart
+    appointment_ids = fields.One2many('clinic.appointment', 'patient_id', string='Appointments',
+                                      context={'active_test': False})
+    treatment_ids = fields.One2many('clinic.treatment', 'patient_id', string='Treatments',
+                                    context={'active_test': False})
     attachment_ids = fields.One2many('ir.attachment', 'res_id', 
                                    domain=[('res_model', '=', 'clinic.patient')],
                                    string='Medical Documents')
     partner_id = fields.Many2one('res.partner', string='Related Partner', ondelete='cascade')
+    partner_sync_pending = fields.Boolean(string='Partner Sync Pending', copy=False,
+                                          help='Partner update deferred to the sync cron')
     
     # Statistics
     appointment_count = fields.Integer(compute='_compute_counts')
@@ -83,11 +113,49 @@ class ClinicPatient(models.Model):
         ('deceased', 'Deceased')
     ], default='active', tracking=True)
     
+    def init(self):
+        self._init_trigram_indexes()
+        # Deferred partner sync queue
+        create_index(self.env.cr, 'clinic_patient_partner_sync_idx', self._table, ['id'],
+                     where="partner_sync_pending")
+    
+    def _init_trigram_indexes(self):
+        """Make sure the quick search fields get GIN trigram indexes.
+
+        Without the pg_trgm extension Odoo silently builds btree indexes for
+        them, which ILIKE searches cannot use. The extension is created when
+        missing, and btree fallbacks left by earlier installs are dropped so
+        the trigram indexes are built in their place once init() is done.
+        """
+        cr = self.env.cr
+        if not self.pool.has_trigram:
+            try:
+                with cr.savepoint():
+                    cr.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            except psycopg2.Error:
+                _logger.warning("The pg_trgm extension cannot be created: patient quick search "
+                                "will not be backed by indexes. Create it as a superuser to fix this.")
+                return
+            self.pool.has_trigram = True
+        for fname, field in self._fields.items():
+            if field.index != 'trigram' or not field.store:
+                continue
+            indexname = make_index_name(self._table, fname)
+            cr.execute("SELECT indexdef FROM pg_indexes WHERE indexname = %s", [indexname])
+            row = cr.fetchone()
+            if row and ' USING gin ' not in row[0]:
+                drop_index(cr, indexname, self._table)
+    
     @api.depends('first_name', 'last_name')
     def _compute_full_name(self):
         for rec in self:
             rec.full_name = f"{rec.first_name or ''} {rec.last_name or ''}".strip()
     
+    @api.depends('phone')
+    def _compute_phone_sanitized(self):
+        for rec in self:
+            rec.phone_sanitized = _phone_digits(rec.phone) or False
+    
     @api.depends('date_of_birth')
     def _compute_age(self):
         for rec in self:
@@ -96,20 +164,44 @@ class ClinicPatient(models.Model):
             else:
                 rec.age = 0
     
+    @api.model
+    @track_performance
+    def _cron_refresh_age(self, batch_size=1000):
+        """Cron job to recompute the stored age of patients whose birthday has passed since the last run"""
+        self.flush_model(['date_of_birth', 'age'])
+        self.env.cr.execute("""
+            SELECT id
+              FROM clinic_patient
+             WHERE date_of_birth IS NOT NULL
+               AND age IS DISTINCT FROM date_part('year', age(%s::date, date_of_birth))::int
+        """, [fields.Date.today()])
+        stale_ids = [row[0] for row in self.env.cr.fetchall()]
+        for ids in split_every(batch_size, stale_ids):
+            patients = self.browse(ids)
+            self.env.add_to_compute(self._fields['age'], patients)
+            patients.flush_recordset(['age'])
+        _logger.info("Patient age refresh: %d patients updated", len(stale_ids))
+    
     @api.depends('appointment_ids', 'treatment_ids')
     def _compute_counts(self):
+        domain = [('patient_id', 'in', self.ids)]
+        Appointment = self.env['clinic.appointment'].with_context(active_test=False)
+        Treatment = self.env['clinic.treatment'].with_context(active_test=False)
+        appointment_counts = dict(Appointment._read_group(domain, ['patient_id'], ['__count']))
+        treatment_counts = dict(Treatment._read_group(domain, ['patient_id'], ['__count']))
         for rec in self:
-            rec.appointment_count = len(rec.appointment_ids)
-            rec.treatment_count = len(rec.treatment_ids)
+            rec.appointment_count = appointment_counts.get(rec._origin, 0)
+            rec.treatment_count = treatment_counts.get(rec._origin, 0)
     
-    @api.depends('appointment_ids.date')
+    @api.depends('appointment_ids.state', 'appointment_ids.date')
     def _compute_last_visit(self):
+        # Only patients whose appointments changed are recomputed
+        last_visits = dict(self.env['clinic.appointment'].with_context(active_test=False)._read_group(
+            [('patient_id', 'in', self.ids), ('state', '=', 'done')],
+            ['patient_id'], ['date:max']))
         for rec in self:
-            appointments = rec.appointment_ids.filtered(lambda a: a.state == 'done')
-            if appointments:
-                rec.last_visit_date = max(appointments.mapped('date')).date()
-            else:
-                rec.last_visit_date = False
+            last_visit = last_visits.get(rec._origin)
+            rec.last_visit_date = last_visit.date() if last_visit else False
     
     @api.depends('insurance_ids', 'insurance_ids.is_primary')
     def _compute_primary_insurance(self):
@@ -117,55 +209,136 @@ class ClinicPatient(models.Model):
             primary = rec.insurance_ids.filtered('is_primary')
             rec.primary_insurance_id = primary[0] if primary else False
     
+    @api.model
+    def _search_display_name(self, operator, value):
+        # Quick search on name, code, email and digits-only phone, all backed by trigram indexes
+        if operator not in ('ilike', '=ilike', '=') or not value or not isinstance(value, str):
+            return super()._search_display_name(operator, value)
+        domains = [
+            [('full_name', operator, value)],
+            [('patient_code', operator, value)],
+            [('email', operator, value)],
+        ]
+        digits = _phone_digits(value)
+        if len(digits) >= 3:
+            domains.append([('phone_sanitized', operator, digits)])
+        return expression.OR(domains)
+    
+    @api.model
+    def name_search(self, name='', args=None, operator='ilike', limit=100):
+        # Rank exact patient code and phone matches before partial matches
+        if not name or operator not in ('ilike', '=ilike', '='):
+            return super().name_search(name, args, operator, limit)
+        domain = args or []
+        exact_domain = [('patient_code', '=ilike', name)]
+        digits = _phone_digits(name)
+        if digits:
+            exact_domain = expression.OR([exact_domain, [('phone_sanitized', '=', digits)]])
+        exact = self.search_fetch(expression.AND([domain, exact_domain]), ['display_name'], limit=limit)
+        result = [(rec.id, rec.display_name) for rec in exact]
+        if limit and len(result) >= limit:
+            return result
+        others = self.search_fetch(
+            expression.AND([domain, [('id', 'not in', exact.ids)], self._search_display_name(operator, name)]),
+            ['display_name'], limit=limit and limit - len(result))
+        return result + [(rec.id, rec.display_name) for rec in others]
+    
     @api.model_create_multi
+    @track_performance
     def create(self, vals_list):
-        for vals in vals_list:
-            if vals.get('patient_code', 'New') == 'New':
-                vals['patient_code'] = self.env['ir.sequence'].next_by_code('clinic.patient') or 'New'
-            
-            # Create corresponding partner if not specified
-            if not vals.get('partner_id'):
-                partner_vals = {
-                    'name': f"{vals.get('first_name', '')} {vals.get('last_name', '')}".strip(),
-                    'phone': vals.get('phone'),
-                    'mobile': vals.get('mobile'),
-                    'email': vals.get('email'),
-                    'street': vals.get('street'),
-                    'street2': vals.get('street2'),
-                    'city': vals.get('city'),
-                    'state_id': vals.get('state_id'),
-                    'country_id': vals.get('country_id'),
-                    'zip': vals.get('zip'),
-                    'is_company': False,
-                    'partner_share': True,
-                    'company_id': vals.get('company_id', self.env.company.id),
-                }
-                partner = self.env['res.partner'].create(partner_vals)
+        to_number = [vals for vals in vals_list if vals.get('patient_code', 'New') == 'New']
+        for vals, code in zip(to_number, self._reserve_patient_codes(len(to_number))):
+            vals['patient_code'] = code
+        
+        # Create corresponding partners if not specified, all in one batch
+        without_partner = [vals for vals in vals_list if not vals.get('partner_id')]
+        if without_partner:
+            partners = self.env['res.partner'].create(
+                [self._prepare_partner_vals(vals) for vals in without_partner])
+            for vals, partner in zip(without_partner, partners):
                 vals['partner_id'] = partner.id
                 
         return super().create(vals_list)
     
+    @api.model
+    def _prepare_partner_vals(self, vals):
+        partner_vals = {field: vals.get(field) for field in PARTNER_SYNC_FIELDS}
+        partner_vals.update({
+            'name': f"{vals.get('first_name', '')} {vals.get('last_name', '')}".strip(),
+            'is_company': False,
+            'partner_share': True,
+            'company_id': vals.get('company_id', self.env.company.id),
+        })
+        return partner_vals
+    
+    @api.model
+    def _reserve_patient_codes(self, count):
+        """Return ``count`` new patient codes, reserved from the sequence in one query
+        when it is a standard (PostgreSQL-backed) sequence."""
+        if not count:
+            return []
+        sequence = self.env['ir.sequence'].sudo().search([
+            ('code', '=', 'clinic.patient'),
+            ('company_id', 'in', [self.env.company.id, False]),
+        ], order='company_id', limit=1)
+        if not sequence or sequence.implementation != 'standard' or sequence.use_date_range:
+            return [self.env['ir.sequence'].next_by_code('clinic.patient') or 'New' for _i in range(count)]
+        self.env.cr.execute("SELECT nextval(%s) FROM generate_series(1, %s)",
+                            ['ir_sequence_%03d' % sequence.id, count])
+        return [sequence.get_next_char(number) for number, in self.env.cr.fetchall()]
+    
+    @track_performance
     def write(self, vals):
         # Update partner information when patient info changes
         res = super().write(vals)
         
-        if any(field in vals for field in ['first_name', 'last_name', 'phone', 'mobile', 
-                                           'email', 'street', 'street2', 'city', 
-                                           'state_id', 'country_id', 'zip']):
-            for rec in self:
-                if rec.partner_id:
-                    partner_vals = {}
-                    if 'first_name' in vals or 'last_name' in vals:
-                        partner_vals['name'] = rec.full_name
-                    for field in ['phone', 'mobile', 'email', 'street', 'street2', 
-                                 'city', 'state_id', 'country_id', 'zip']:
-                        if field in vals:
-                            partner_vals[field] = vals[field]
-                    if partner_vals:
-                        rec.partner_id.write(partner_vals)
+        sync_fields = [field for field in PARTNER_SYNC_FIELDS if field in vals]
+        if 'first_name' in vals or 'last_name' in vals:
+            sync_fields.append('name')
+        if sync_fields:
+            if self.env.context.get('clinic_defer_partner_sync'):
+                self.partner_sync_pending = True
+            else:
+                self._sync_partners(sync_fields)
         
         return res
     
+    def _sync_partners(self, field_names=PARTNER_SYNC_FIELDS + ('name',)):
+        """Copy patient values to the related partners.
+
+        Partners receiving the same values are written together: the address and
+        contact fields are shared by the whole recordset when they come from a
+        single write, so only ``name`` needs one write per distinct full name.
+        """
+        patients = self.filtered('partner_id')
+        partners_by_vals = defaultdict(lambda: self.env['res.partner'])
+        for rec in patients:
+            partner_vals = tuple(
+                (field, rec._fields[field].convert_to_write(rec[field], rec))
+                for field in field_names if field != 'name'
+            )
+            partners_by_vals[partner_vals] |= rec.partner_id
+        for partner_vals, partners in partners_by_vals.items():
+            if partner_vals:
+                partners.write(dict(partner_vals))
+        
+        if 'name' in field_names:
+            partners_by_name = defaultdict(lambda: self.env['res.partner'])
+            for rec in patients:
+                partners_by_name[rec.full_name] |= rec.partner_id
+            for name, partners in partners_by_name.items():
+                partners.write({'name': name})
+    
+    @api.model
+    @track_performance
+    def _cron_sync_partners(self, batch_size=1000):
+        """Cron job to flush partner updates deferred with the clinic_defer_partner_sync context key"""
+        pending = self.search([('partner_sync_pending', '=', True)])
+        for ids in split_every(batch_size, pending.ids):
+            patients = self.browse(ids)
+            patients._sync_partners()
+            patients.partner_sync_pending = False
+    
     def action_view_appointments(self):
         return {
             'type': 'ir.actions.act_window',
@@ -173,7 +346,7 @@ class ClinicPatient(models.Model):
             'res_model': 'clinic.appointment',
             'view_mode': 'calendar,tree,form',
             'domain': [('patient_id', '=', self.id)],
-            'context': {'default_patient_id': self.id}
+            'context': {'default_patient_id': self.id, 'active_test': False}
         }
     
     def action_view_treatments(self):
@@ -183,5 +356,5 @@ class ClinicPatient(models.Model):
             'res_model': 'clinic.treatment',
             'view_mode': 'tree,form',
             'domain': [('patient_id', '=', self.id)],
-            'context': {'default_patient_id': self.id}
+            'context': {'default_patient_id': self.id, 'active_test': False}
         }
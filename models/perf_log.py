@@ -0,0 +1,137 @@
+import functools
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from odoo import models, fields, api, tools
+
+_logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def perf_tracker(records, method):
+    """Measure the enclosed block as a call of ``method`` on ``records``.
+
+    A share of the calls given by the ``medical_clinic.perf_sample_rate``
+    system parameter (0 to 1, disabled by default) is recorded in
+    clinic.perf.log. The block can update the yielded dict, e.g. its
+    ``records`` key once the processed records are known.
+    """
+    env = records.env
+    rate = float(env['ir.config_parameter'].sudo().get_param('medical_clinic.perf_sample_rate') or 0)
+    stats = {'records': len(records)}
+    if rate <= 0 or random.random() >= rate:
+        yield stats
+        return
+    # The cursor counts queries and their time on the thread once these are set,
+    # as the HTTP and cron workers do
+    thread = threading.current_thread()
+    if not hasattr(thread, 'query_count'):
+        thread.query_count = 0
+        thread.query_time = 0.0
+    query_count, query_time = thread.query_count, thread.query_time
+    started = time.perf_counter()
+    yield stats
+    duration = time.perf_counter() - started
+    sql_time = thread.query_time - query_time
+    vals = {
+        'name': method,
+        'model': records._name,
+        'record_count': stats['records'],
+        'query_count': thread.query_count - query_count,
+        'sql_time': 1000 * sql_time,
+        'python_time': 1000 * max(duration - sql_time, 0.0),
+        'duration': 1000 * duration,
+        'user_id': env.uid,
+        'company_id': env.company.id,
+    }
+    _logger.debug("perf %s", vals)
+    env['clinic.perf.log'].sudo().create(vals)
+
+
+def track_performance(method):
+    """Decorate a model method so its sampled calls are recorded by perf_tracker.
+
+    Methods returning records of their own model, such as create, are
+    counted by the records returned, the others by the records called on.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with perf_tracker(self, method.__name__) as stats:
+            result = method(self, *args, **kwargs)
+            if isinstance(result, models.BaseModel) and result._name == self._name:
+                stats['records'] = len(result)
+        return result
+    return wrapper
+
+
+class ClinicPerfLog(models.Model):
+    _name = 'clinic.perf.log'
+    _description = 'Clinic Performance Sample'
+    _order = 'id desc'
+    
+    name = fields.Char(string='Method', required=True, readonly=True, index=True)
+    model = fields.Char(string='Model', required=True, readonly=True)
+    record_count = fields.Integer(string='Records', readonly=True)
+    query_count = fields.Integer(string='Queries', readonly=True)
+    sql_time = fields.Float(string='SQL Time (ms)', readonly=True)
+    python_time = fields.Float(string='Python Time (ms)', readonly=True)
+    duration = fields.Float(string='Duration (ms)', readonly=True)
+    user_id = fields.Many2one('res.users', string='User', readonly=True)
+    company_id = fields.Many2one('res.company', string='Company', readonly=True)
+    
+    @api.autovacuum
+    def _gc_perf_logs(self):
+        """Drop the samples older than ``medical_clinic.perf_log_days``"""
+        days = int(self.env['ir.config_parameter'].sudo().get_param('medical_clinic.perf_log_days', 30))
+        self.env.cr.execute("DELETE FROM clinic_perf_log WHERE create_date < %s",
+                            [fields.Datetime.now() - timedelta(days=days)])
+        _logger.info("Performance log: %d sample(s) older than %d days removed", self.env.cr.rowcount, days)
+
+
+class ClinicPerfReport(models.Model):
+    _name = 'clinic.perf.report'
+    _description = 'Clinic Performance Statistics'
+    _auto = False
+    _order = 'date desc, name'
+    
+    # Percentiles are computed per method and day; the pivot averages them across days
+    date = fields.Date(string='Date', readonly=True)
+    name = fields.Char(string='Method', readonly=True)
+    model = fields.Char(string='Model', readonly=True)
+    company_id = fields.Many2one('res.company', string='Company', readonly=True)
+    call_count = fields.Integer(string='Calls', readonly=True)
+    record_count = fields.Integer(string='Records', readonly=True)
+    query_count = fields.Integer(string='Queries', readonly=True)
+    duration_p50 = fields.Float(string='Duration p50 (ms)', readonly=True, aggregator='avg')
+    duration_p95 = fields.Float(string='Duration p95 (ms)', readonly=True, aggregator='avg')
+    sql_time_p50 = fields.Float(string='SQL Time p50 (ms)', readonly=True, aggregator='avg')
+    sql_time_p95 = fields.Float(string='SQL Time p95 (ms)', readonly=True, aggregator='avg')
+    query_count_p50 = fields.Float(string='Queries p50', readonly=True, aggregator='avg')
+    query_count_p95 = fields.Float(string='Queries p95', readonly=True, aggregator='avg')
+    
+    def init(self):
+        tools.drop_view_if_exists(self.env.cr, self._table)
+        self.env.cr.execute(f"""
+            CREATE VIEW {self._table} AS (
+                SELECT min(l.id) AS id,
+                       l.create_date::date AS date,
+                       l.name,
+                       l.model,
+                       l.company_id,
+                       count(*) AS call_count,
+                       sum(l.record_count) AS record_count,
+                       sum(l.query_count) AS query_count,
+                       percentile_cont(0.5) WITHIN GROUP (ORDER BY l.duration) AS duration_p50,
+                       percentile_cont(0.95) WITHIN GROUP (ORDER BY l.duration) AS duration_p95,
+                       percentile_cont(0.5) WITHIN GROUP (ORDER BY l.sql_time) AS sql_time_p50,
+                       percentile_cont(0.95) WITHIN GROUP (ORDER BY l.sql_time) AS sql_time_p95,
+                       percentile_cont(0.5) WITHIN GROUP (ORDER BY l.query_count) AS query_count_p50,
+                       percentile_cont(0.95) WITHIN GROUP (ORDER BY l.query_count) AS query_count_p95
+                  FROM clinic_perf_log l
+              GROUP BY l.create_date::date, l.name, l.model, l.company_id
+            )
+        """)
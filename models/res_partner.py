@@ -10,8 +10,10 @@ class ResPartner(models.Model):
     patient_count = fields.Integer(compute='_compute_patient_count', string='Patient Count')
     
     def _compute_patient_count(self):
+        counts = dict(self.env['clinic.patient']._read_group(
+            [('partner_id', 'in', self.ids)], ['partner_id'], ['__count']))
         for partner in self:
-            partner.patient_count = len(partner.patient_ids)
+            partner.patient_count = counts.get(partner._origin, 0)
     
     def action_view_patients(self):
         return {
@@ -1,5 +1,35 @@
-from odoo import models, fields, api, _
+import io
+import logging
+import os
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from odoo import models, fields, api, Command, _
 from odoo.exceptions import UserError
+from odoo.osv import expression
+from odoo.tools import split_every
+from odoo.tools.pdf import merge_pdf
+from odoo.tools.safe_eval import safe_eval
+from odoo.tools.sql import create_index
+
+from .perf_log import track_performance
+
+_logger = logging.getLogger(__name__)
+
+# Treatments rendered by one wkhtmltopdf run in batch printing
+REPORT_CHUNK_SIZE = 50
+
+
+def _render_report_chunk(registry, uid, context, report_ref, res_ids):
+    """Render one chunk of a report in its own cursor, saving the PDFs as cache attachments.
+
+    Runs in a worker thread; returns {res_id: pdf bytes}.
+    """
+    with registry.cursor() as cr:
+        env = api.Environment(cr, uid, context)
+        return env['clinic.treatment'].browse(res_ids)._render_report_pdfs(report_ref)
 
 class ClinicTreatment(models.Model):
     _name = 'clinic.treatment'
@@ -11,11 +41,11 @@ class ClinicTreatment(models.Model):
     treatment_code = fields.Char(string='Treatment #', required=True, copy=False,
                                 default='New', readonly=True)
     patient_id = fields.Many2one('clinic.patient', string='Patient', required=True,
-                                ondelete='restrict')
+                                ondelete='restrict', index=True)
     doctor_id = fields.Many2one('hr.employee', string='Doctor', required=True,
-                               domain=[('is_medical_professional', '=', True)])
-    appointment_id = fields.Many2one('clinic.appointment', string='Appointment')
-    date = fields.Datetime(string='Date', required=True, default=fields.Datetime.now)
+                               domain=[('is_medical_professional', '=', True)], index=True)
+    appointment_id = fields.Many2one('clinic.appointment', string='Appointment', index='btree_not_null')
+    date = fields.Datetime(string='Date', required=True, default=fields.Datetime.now, index=True)
     
     # Chief Complaint & History
     chief_complaint = fields.Text(string='Chief Complaint', required=True)
@@ -71,6 +101,9 @@ class ClinicTreatment(models.Model):
     company_id = fields.Many2one('res.company', string='Company', required=True,
                                 default=lambda self: self.env.company)
     
+    # Archived once past the archive horizon
+    active = fields.Boolean(default=True)
+    
     # Type
     treatment_type = fields.Selection([
         ('consultation', 'Consultation'),
@@ -80,6 +113,11 @@ class ClinicTreatment(models.Model):
         ('follow_up', 'Follow-up')
     ], string='Type', default='consultation')
     
+    def init(self):
+        # Invoicing cron: completed treatments without an invoice
+        create_index(self.env.cr, 'clinic_treatment_to_invoice_idx', self._table, ['patient_id', 'id'],
+                     where="state = 'done' AND invoice_id IS NULL")
+    
     @api.depends('weight', 'height')
     def _compute_bmi(self):
         for rec in self:
@@ -90,69 +128,318 @@ class ClinicTreatment(models.Model):
                 rec.bmi = 0
     
     @api.model_create_multi
+    @track_performance
     def create(self, vals_list):
         for vals in vals_list:
             if vals.get('treatment_code', 'New') == 'New':
                 vals['treatment_code'] = self.env['ir.sequence'].next_by_code('clinic.treatment') or 'New'
         return super().create(vals_list)
     
+    @track_performance
     def action_complete(self):
-        self.ensure_one()
-        if not self.diagnosis_ids:
+        if any(not rec.diagnosis_ids for rec in self):
             raise UserError(_('Please add at least one diagnosis before completing the treatment.'))
-        self.state = 'done'
+        self.write({'state': 'done'})
         
         # Create invoice if procedures or services were performed
-        if self.procedure_ids and not self.invoice_id:
-            self._create_invoice()
+        to_invoice = self.filtered(lambda t: t.procedure_ids and not t.invoice_id)
+        if to_invoice:
+            to_invoice._create_invoices()
     
     def action_print_prescription(self):
         self.ensure_one()
         return self.env.ref('medical_clinic.action_report_prescription').report_action(self)
     
-    def _create_invoice(self):
-        invoice_vals = {
+    @track_performance
+    def action_print_batch(self, report_ref, output='pdf'):
+        """Download a report of all the selected treatments, merged or zipped"""
+        return {
+            'type': 'ir.actions.act_url',
+            'url': '/medical_clinic/report/batch?report_ref=%s&output=%s&ids=%s' % (
+                report_ref, output, ','.join(map(str, self.ids))),
+            'target': 'self',
+        }
+    
+    @api.model
+    def _get_report_workers(self):
+        default = min(4, os.cpu_count() or 1)
+        return int(self.env['ir.config_parameter'].sudo().get_param('medical_clinic.report_workers', default))
+    
+    @api.model
+    def _get_batch_report(self, report_ref):
+        """Return the report ``report_ref``, which must print treatments"""
+        try:
+            report = self.env['ir.actions.report']._get_report(report_ref)
+        except ValueError:
+            report = self.env['ir.actions.report']
+        if report.model != self._name:
+            raise UserError(_('%s is not a treatment report.', report_ref))
+        return report
+    
+    def _render_report_batch(self, report_ref, parallel=False):
+        """Return {treatment_id: pdf bytes} for a report, rendering only what is not cached.
+
+        Rendered documents are saved as attachments named after the record's
+        write_date, so unchanged treatments are served from the cache. The others
+        are rendered in chunks, one wkhtmltopdf process per chunk.
+
+        With ``parallel``, chunks are rendered by worker threads each using its
+        own cursor. This commits the current transaction first so the workers
+        see its data, and is therefore reserved to cron jobs.
+        """
+        report = self._get_batch_report(report_ref)
+        started = time.perf_counter()
+        pdfs = self._get_cached_report_pdfs(report)
+        missing = self.filtered(lambda t: t.id not in pdfs)
+        chunks = [list(ids) for ids in split_every(REPORT_CHUNK_SIZE, missing.ids)]
+        if not parallel or getattr(threading.current_thread(), 'testing', False) or len(chunks) <= 1:
+            for ids in chunks:
+                pdfs.update(self.browse(ids)._render_report_pdfs(report_ref))
+        else:
+            self.env.cr.commit()
+            with ThreadPoolExecutor(max_workers=self._get_report_workers()) as executor:
+                futures = [
+                    executor.submit(_render_report_chunk, self.env.registry, self.env.uid,
+                                    dict(self.env.context), report_ref, ids)
+                    for ids in chunks
+                ]
+            for future in futures:
+                pdfs.update(future.result())
+        elapsed = time.perf_counter() - started
+        _logger.info("Batch report %s: %d document(s), %d from cache, %d rendered in %d chunk(s), %.2fs",
+                     report.report_name, len(self), len(self) - len(missing), len(missing), len(chunks), elapsed)
+        return pdfs
+    
+    def _get_report_batch_file(self, report_ref, output='pdf'):
+        """Return (filename, mimetype, content) of a report for all these treatments,
+        as one merged PDF or a zip of one PDF per treatment"""
+        report = self._get_batch_report(report_ref)
+        pdfs = self._render_report_batch(report_ref)
+        # Documents the batch render could not split are rendered one by one
+        for rec in self.filtered(lambda t: not pdfs.get(t.id)):
+            pdfs.update(rec._render_report_pdfs(report_ref))
+        unrendered = self.filtered(lambda t: not pdfs.get(t.id))
+        if unrendered:
+            raise UserError(_('The report could not be rendered for %s.',
+                              ', '.join(unrendered.mapped('treatment_code'))))
+        if output == 'zip':
+            buffer = io.BytesIO()
+            with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+                for rec in self:
+                    archive.writestr('%s.pdf' % rec.treatment_code.replace('/', '-'), pdfs[rec.id])
+            return '%s.zip' % report.name, 'application/zip', buffer.getvalue()
+        return '%s.pdf' % report.name, 'application/pdf', merge_pdf([pdfs[rec.id] for rec in self])
+    
+    def _get_cached_report_pdfs(self, report):
+        if not report.attachment_use or not report.attachment:
+            return {}
+        names = {rec.id: safe_eval(report.attachment, {'object': rec, 'time': time}) for rec in self}
+        attachments = self.env['ir.attachment'].sudo().search([
+            ('res_model', '=', self._name),
+            ('res_id', 'in', self.ids),
+            ('name', 'in', list(names.values())),
+        ])
+        return {
+            attachment.res_id: attachment.raw
+            for attachment in attachments
+            if names.get(attachment.res_id) == attachment.name
+        }
+    
+    def _render_report_pdfs(self, report_ref):
+        """Render a report for these treatments in one wkhtmltopdf run, store one
+        cache attachment per treatment and drop the outdated ones"""
+        Report = self.env['ir.actions.report']
+        report = Report._get_report(report_ref)
+        streams = Report._render_qweb_pdf_prepare_streams(report_ref, {'report_type': 'pdf'}, res_ids=self.ids)
+        attachment_vals_list = Report._prepare_pdf_report_attachment_vals_list(report, streams)
+        if attachment_vals_list:
+            Attachment = self.env['ir.attachment'].sudo()
+            attachments = Attachment.create(attachment_vals_list)
+            # Cache names end with the write_date: older versions share everything before it
+            Attachment.search(expression.AND([
+                [('res_model', '=', self._name), ('id', 'not in', attachments.ids)],
+                expression.OR([
+                    [('res_id', '=', attachment.res_id), ('name', '=like', attachment.name.rsplit('-', 1)[0] + '-%.pdf')]
+                    for attachment in attachments
+                ]),
+            ])).unlink()
+        return {res_id: stream['stream'].getvalue() for res_id, stream in streams.items() if res_id and stream['stream']}
+    
+    @track_performance
+    def action_create_invoices(self):
+        """Invoice the selected completed treatments in one batch"""
+        treatments = self.filtered(lambda t: t.state == 'done' and t.procedure_ids and not t.invoice_id)
+        started = time.perf_counter()
+        invoices = treatments._create_invoices(consolidate=self._consolidate_invoices())
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'type': 'success',
+                'message': _('%(count)s invoice(s) created for %(treatments)s treatment(s) in %(duration).2fs',
+                             count=len(invoices), treatments=len(treatments),
+                             duration=time.perf_counter() - started),
+                'next': {'type': 'ir.actions.act_window_close'},
+            },
+        }
+    
+    @api.model
+    def _consolidate_invoices(self):
+        return bool(self.env['ir.config_parameter'].sudo().get_param('medical_clinic.consolidate_invoices'))
+    
+    @track_performance
+    def _create_invoices(self, consolidate=False):
+        """Create the invoices, and insurance claims of insured patients, for the
+        treatments with one create call each.
+
+        :param consolidate: one invoice per patient instead of one per treatment
+        :return: the created invoices
+        """
+        groups = list(self.grouped('patient_id').values()) if consolidate else list(self)
+        if not groups:
+            return self.env['account.move']
+        invoices = self.env['account.move'].create([group._prepare_invoice_vals() for group in groups])
+        for group, invoice in zip(groups, invoices):
+            group.invoice_id = invoice
+        
+        # Create insurance claims if patients have insurance
+        insured = [(group, invoice) for group, invoice in zip(groups, invoices)
+                   if group.patient_id.primary_insurance_id]
+        if insured:
+            claims = self.env['clinic.insurance.claim'].create(
+                [group._prepare_insurance_claim_vals(invoice) for group, invoice in insured])
+            for (group, _invoice), claim in zip(insured, claims):
+                group.insurance_claim_id = claim
+        return invoices
+    
+    def _prepare_invoice_vals(self):
+        """Invoice values for treatments of a single patient"""
+        patient = self.patient_id
+        patient.ensure_one()
+        return {
             'move_type': 'out_invoice',
-            'partner_id': self.patient_id.partner_id.id,
-            'patient_id': self.patient_id.id,
-            'treatment_id': self.id,
+            'partner_id': patient.partner_id.id,
+            'patient_id': patient.id,
+            'treatment_id': self.id if len(self) == 1 else False,
             'invoice_date': fields.Date.today(),
-            'invoice_line_ids': [],
+            'invoice_line_ids': [
+                Command.create({
+                    'product_id': service.product_id.id,
+                    'name': service.name if len(self) == 1 else f"{treatment.treatment_code} - {service.name}",
+                    'quantity': 1,
+                    'price_unit': service.price,
+                })
+                for treatment in self
+                for service in treatment.procedure_ids
+            ],
         }
-        
-        for service in self.procedure_ids:
-            invoice_vals['invoice_line_ids'].append((0, 0, {
-                'product_id': service.product_id.id,
-                'name': service.name,
-                'quantity': 1,
-                'price_unit': service.price,
-            }))
-        
-        invoice = self.env['account.move'].create(invoice_vals)
-        self.invoice_id = invoice
-        
-        # Create insurance claim if patient has insurance
-        if self.patient_id.primary_insurance_id:
-            self._create_insurance_claim(invoice)
     
-    def _create_insurance_claim(self, invoice):
-        claim_vals = {
+    def _prepare_insurance_claim_vals(self, invoice):
+        return {
             'patient_id': self.patient_id.id,
             'insurance_id': self.patient_id.primary_insurance_id.id,
-            'treatment_id': self.id,
+            'treatment_id': self[:1].id,
             'invoice_id': invoice.id,
             'claim_date': fields.Date.today(),
+            'service_date': min(self.mapped('date')).date(),
+            'diagnosis_codes': ', '.join(code for code in self.diagnosis_ids.mapped('icd_code') if code),
+            'procedure_codes': ', '.join(self.procedure_ids.mapped('code')),
             'amount_claimed': invoice.amount_total,
         }
-        claim = self.env['clinic.insurance.claim'].create(claim_vals)
-        self.insurance_claim_id = claim
+    
+    @api.model
+    @track_performance
+    def _cron_render_daily_reports(self):
+        """Cron job to render the documents of the treatments completed today into the report cache"""
+        today = fields.Date.context_today(self)
+        treatments = self.search([
+            ('state', '=', 'done'),
+            ('date', '>=', fields.Datetime.to_datetime(today)),
+        ])
+        for report_ref in ('medical_clinic.action_report_prescription', 'medical_clinic.action_report_treatment'):
+            treatments._render_report_batch(report_ref, parallel=True)
+    
+    @api.model
+    @track_performance
+    def _cron_archive_history(self, batch_size=5000):
+        """Cron job to archive closed treatments older than the archive horizon
+
+        Completed treatments still waiting for an invoice are kept active so the
+        invoicing cron picks them up.
+        """
+        auto_commit = not getattr(threading.current_thread(), 'testing', False)
+        archive_date = self.env['clinic.appointment']._get_archive_date()
+        procedures = self._fields['procedure_ids']
+        started = time.perf_counter()
+        archived = 0
+        self.flush_model(['active', 'state', 'date', 'invoice_id', 'procedure_ids'])
+        while True:
+            self.env.cr.execute(f"""
+                UPDATE clinic_treatment
+                   SET active = false
+                 WHERE id IN (SELECT t.id
+                                FROM clinic_treatment t
+                               WHERE t.active
+                                 AND t.date < %s
+                                 AND (t.state = 'cancelled'
+                                      OR (t.state = 'done'
+                                          AND (t.invoice_id IS NOT NULL
+                                               OR NOT EXISTS (SELECT 1
+                                                                FROM {procedures.relation} rel
+                                                               WHERE rel.{procedures.column1} = t.id))))
+                               LIMIT %s)
+             RETURNING id
+            """, [archive_date, batch_size])
+            ids = [row[0] for row in self.env.cr.fetchall()]
+            if not ids:
+                break
+            self.browse(ids).invalidate_recordset(['active'])
+            archived += len(ids)
+            if auto_commit:
+                self.env.cr.commit()
+        elapsed = time.perf_counter() - started
+        _logger.info("Treatment archival: %d archived before %s in %.2fs",
+                     archived, archive_date, elapsed)
+        return {'archived': archived, 'duration': elapsed}
+    
+    @api.model
+    @track_performance
+    def _cron_invoice_completed_treatments(self, batch_size=500):
+        """Cron job to invoice completed treatments that have not been invoiced yet"""
+        auto_commit = not getattr(threading.current_thread(), 'testing', False)
+        consolidate = self._consolidate_invoices()
+        # Chunks hold whole patients, so a consolidated invoice is never split across two chunks
+        groups = self._read_group([
+            ('state', '=', 'done'),
+            ('invoice_id', '=', False),
+            ('procedure_ids', '!=', False),
+        ], ['patient_id'], ['id:array_agg'], order='patient_id')
+        chunks = [[]]
+        for _patient, ids in groups:
+            if chunks[-1] and len(chunks[-1]) + len(ids) > batch_size:
+                chunks.append([])
+            chunks[-1] += sorted(ids)
+        started = time.perf_counter()
+        treatment_count = invoice_count = 0
+        for ids in chunks:
+            if not ids:
+                continue
+            invoice_count += len(self.browse(ids)._create_invoices(consolidate=consolidate))
+            treatment_count += len(ids)
+            if auto_commit:
+                self.env.cr.commit()
+        elapsed = time.perf_counter() - started
+        _logger.info("Treatment invoicing: %d treatments, %d invoices in %.2fs (%.1f treatments/s)",
+                     treatment_count, invoice_count, elapsed, treatment_count / elapsed if elapsed else 0.0)
+        return {'treatments': treatment_count, 'invoices': invoice_count, 'duration': elapsed}
 
 
 class ClinicDiagnosis(models.Model):
     _name = 'clinic.diagnosis'
     _description = 'Diagnosis Line'
     
-    treatment_id = fields.Many2one('clinic.treatment', string='Treatment', required=True, ondelete='cascade')
+    treatment_id = fields.Many2one('clinic.treatment', string='Treatment', required=True, ondelete='cascade',
+                                   index=True)
     diagnosis = fields.Char(string='Diagnosis', required=True)
     icd_code = fields.Char(string='ICD Code')
     notes = fields.Text(string='Notes')
@@ -166,7 +453,8 @@ class ClinicPrescription(models.Model):
     _name = 'clinic.prescription'
     _description = 'Prescription Line'
     
-    treatment_id = fields.Many2one('clinic.treatment', string='Treatment', required=True, ondelete='cascade')
+    treatment_id = fields.Many2one('clinic.treatment', string='Treatment', required=True, ondelete='cascade',
+                                   index=True)
     medicine_id = fields.Many2one('product.product', string='Medicine', required=True,
                                  domain=[('is_medicine', '=', True)])
     dosage = fields.Char(string='Dosage', required=True)
@@ -198,7 +486,8 @@ class ClinicLabTest(models.Model):
     _name = 'clinic.lab.test'
     _description = 'Lab Test Request'
     
-    treatment_id = fields.Many2one('clinic.treatment', string='Treatment', required=True, ondelete='cascade')
+    treatment_id = fields.Many2one('clinic.treatment', string='Treatment', required=True, ondelete='cascade',
+                                   index=True)
     test_type = fields.Selection([
         ('blood', 'Blood Test'),
         ('urine', 'Urine Test'),
@@ -0,0 +1 @@
+from . import clinic_report
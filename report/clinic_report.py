@@ -0,0 +1,151 @@
+from odoo import models, fields, api
+
+from ..models.perf_log import track_performance
+
+# Reporting models refreshed together by the reporting cron
+REPORT_MODELS = (
+    'clinic.appointment.report',
+    'clinic.service.revenue.report',
+    'clinic.claim.report',
+)
+
+
+class ClinicMaterializedReport(models.AbstractModel):
+    _name = 'clinic.materialized.report'
+    _description = 'Clinic Materialized Report'
+    _auto = False
+    
+    # Columns identifying a row, backing the unique index needed by concurrent refreshes
+    _report_key = ()
+    
+    def _query(self):
+        raise NotImplementedError()
+    
+    def init(self):
+        if self._abstract:
+            return
+        self.env.cr.execute(f"DROP MATERIALIZED VIEW IF EXISTS {self._table}")
+        self.env.cr.execute(f"CREATE MATERIALIZED VIEW {self._table} AS ({self._query()})")
+        self.env.cr.execute(
+            f"CREATE UNIQUE INDEX {self._table}_key_idx ON {self._table} ({', '.join(self._report_key)})")
+    
+    @api.model
+    def _refresh(self):
+        # The whole query runs again: the concurrent refresh only keeps the report
+        # readable meanwhile, hence the nightly schedule of the cron
+        self.env.flush_all()
+        self.env.cr.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {self._table}")
+        self.invalidate_model()
+    
+    @api.model
+    @track_performance
+    def _cron_refresh_reports(self):
+        """Cron job to refresh all clinic reporting tables"""
+        for model_name in REPORT_MODELS:
+            self.env[model_name]._refresh()
+
+
+class ClinicAppointmentReport(models.Model):
+    _name = 'clinic.appointment.report'
+    _inherit = 'clinic.materialized.report'
+    _description = 'Daily Appointment Statistics'
+    _auto = False
+    _order = 'date desc'
+    _report_key = ('date', 'doctor_id', 'department', 'state', 'company_id')
+    
+    date = fields.Date(string='Date', readonly=True)
+    doctor_id = fields.Many2one('hr.employee', string='Doctor', readonly=True)
+    department = fields.Selection(selection=lambda self: self.env['clinic.appointment']._fields['department'].selection,
+                                  string='Department', readonly=True)
+    state = fields.Selection(selection=lambda self: self.env['clinic.appointment']._fields['state'].selection,
+                             string='Status', readonly=True)
+    company_id = fields.Many2one('res.company', string='Company', readonly=True)
+    appointment_count = fields.Integer(string='Appointments', readonly=True)
+    booked_hours = fields.Float(string='Booked Hours', readonly=True)
+    
+    def _query(self):
+        return """
+            SELECT min(a.id) AS id,
+                   a.date::date AS date,
+                   a.doctor_id,
+                   a.department,
+                   a.state,
+                   a.company_id,
+                   count(*) AS appointment_count,
+                   sum(a.duration) AS booked_hours
+              FROM clinic_appointment a
+          GROUP BY a.date::date, a.doctor_id, a.department, a.state, a.company_id
+        """
+
+
+class ClinicServiceRevenueReport(models.Model):
+    _name = 'clinic.service.revenue.report'
+    _inherit = 'clinic.materialized.report'
+    _description = 'Daily Revenue per Service'
+    _auto = False
+    _order = 'date desc'
+    _report_key = ('date', 'service_id', 'company_id')
+    
+    date = fields.Date(string='Date', readonly=True)
+    service_id = fields.Many2one('clinic.service', string='Service', readonly=True)
+    department = fields.Selection(selection=lambda self: self.env['clinic.service']._fields['department'].selection,
+                                  string='Department', readonly=True)
+    company_id = fields.Many2one('res.company', string='Company', readonly=True)
+    procedure_count = fields.Integer(string='Procedures', readonly=True)
+    revenue = fields.Float(string='Revenue', readonly=True)
+    
+    def _query(self):
+        procedures = self.env['clinic.treatment']._fields['procedure_ids']
+        return f"""
+            SELECT row_number() OVER (ORDER BY t.date::date, rel.{procedures.column2}, t.company_id) AS id,
+                   t.date::date AS date,
+                   rel.{procedures.column2} AS service_id,
+                   min(s.department) AS department,
+                   t.company_id,
+                   count(*) AS procedure_count,
+                   sum(s.price) AS revenue
+              FROM clinic_treatment t
+              JOIN {procedures.relation} rel ON rel.{procedures.column1} = t.id
+              JOIN clinic_service s ON s.id = rel.{procedures.column2}
+             WHERE t.state = 'done'
+          GROUP BY t.date::date, rel.{procedures.column2}, t.company_id
+        """
+
+
+class ClinicClaimReport(models.Model):
+    _name = 'clinic.claim.report'
+    _inherit = 'clinic.materialized.report'
+    _description = 'Daily Insurance Claim Statistics'
+    _auto = False
+    _order = 'date desc'
+    _report_key = ('date', 'insurance_company_id', 'company_id')
+    
+    date = fields.Date(string='Claim Date', readonly=True)
+    insurance_company_id = fields.Many2one('res.partner', string='Insurance Company', readonly=True)
+    company_id = fields.Many2one('res.company', string='Company', readonly=True)
+    claim_count = fields.Integer(string='Claims', readonly=True)
+    approved_count = fields.Integer(string='Approved Claims', readonly=True)
+    rejected_count = fields.Integer(string='Rejected Claims', readonly=True)
+    amount_claimed = fields.Float(string='Amount Claimed', readonly=True)
+    amount_approved = fields.Float(string='Amount Approved', readonly=True)
+    approval_rate = fields.Float(string='Approval Rate (%)', readonly=True, aggregator='avg',
+                                 help='Approved claims out of the claims decided that day')
+    
+    def _query(self):
+        return """
+            SELECT row_number() OVER (ORDER BY c.claim_date, i.insurance_company_id, c.company_id) AS id,
+                   c.claim_date AS date,
+                   i.insurance_company_id,
+                   c.company_id,
+                   count(*) AS claim_count,
+                   count(*) FILTER (WHERE c.state IN ('approved', 'partial', 'paid')) AS approved_count,
+                   count(*) FILTER (WHERE c.state = 'rejected') AS rejected_count,
+                   sum(c.amount_claimed) AS amount_claimed,
+                   sum(coalesce(c.amount_approved, 0)) AS amount_approved,
+                   100.0 * count(*) FILTER (WHERE c.state IN ('approved', 'partial', 'paid'))
+                       / nullif(count(*) FILTER (WHERE c.state IN ('approved', 'partial', 'paid', 'rejected')), 0)
+                       AS approval_rate
+              FROM clinic_insurance_claim c
+              JOIN clinic_insurance i ON i.id = c.insurance_id
+          GROUP BY c.claim_date, i.insurance_company_id, c.company_id
+        """
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""Seed a synthetic clinic and benchmark the medical_clinic module.
+
+Usage:
+    python clinic_benchmark.py -c odoo.conf -d bench_db --patients 50000 --baseline clinic_baseline.json
+
+The module must be installed in the database. Everything runs in one
+transaction rolled back at the end unless --keep is given. The process exits
+with status 1 when a query plan or a flow regresses against the baseline.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+
+import odoo
+from odoo import api, SUPERUSER_ID
+
+_logger = logging.getLogger('medical_clinic.benchmark')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-c', '--config', help='Odoo configuration file')
+    parser.add_argument('-d', '--database', required=True)
+    parser.add_argument('--patients', type=int, default=10000)
+    parser.add_argument('--doctors', type=int, default=50)
+    parser.add_argument('--appointments-per-patient', type=int, default=5)
+    parser.add_argument('--treatments-per-patient', type=int, default=2)
+    parser.add_argument('--no-seed', action='store_true', help='benchmark the data already in the database')
+    parser.add_argument('--samples', type=int, default=20, help='runs of each flow')
+    parser.add_argument('--repeat', type=int, default=3, help='EXPLAIN ANALYZE runs of each query')
+    parser.add_argument('--tolerance', type=float, default=1.5, help='allowed slowdown against the baseline')
+    parser.add_argument('--baseline', help='baseline JSON file to compare with')
+    parser.add_argument('--update-baseline', action='store_true', help='write the results to the baseline file')
+    parser.add_argument('--keep', action='store_true', help='commit the generated data')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    odoo.tools.config.parse_config((['-c', args.config] if args.config else []) + ['-d', args.database])
+    # Crons skip their intermediate commits, which would defeat the final rollback,
+    # and no mail leaves the server
+    threading.current_thread().testing = True
+
+    baseline = {}
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    registry = odoo.modules.registry.Registry(args.database)
+    with registry.cursor() as cr:
+        env = api.Environment(cr, SUPERUSER_ID, {})
+        benchmark = env['clinic.benchmark']
+        if not args.no_seed:
+            benchmark._seed(
+                patients=args.patients,
+                doctors=args.doctors,
+                appointments_per_patient=args.appointments_per_patient,
+                treatments_per_patient=args.treatments_per_patient,
+            )
+        report = benchmark.run_benchmark(samples=args.samples, repeat=args.repeat,
+                                         tolerance=args.tolerance, baseline=baseline)
+        if args.keep:
+            cr.commit()
+        else:
+            cr.rollback()
+
+    regressions = report.pop('regressions')
+    json.dump(report, sys.stdout, indent=1, sort_keys=True)
+    sys.stdout.write('\n')
+    if args.baseline and args.update_baseline:
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(report, baseline_file, indent=1, sort_keys=True)
+        _logger.info("Baseline written to %s", args.baseline)
+    for regression in regressions:
+        _logger.error("Regression: %s", regression)
+    return 1 if regressions and not args.update_baseline else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
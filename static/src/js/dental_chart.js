@@ -1,13 +1,28 @@
 /** @odoo-module **/
 
 import { registry } from "@web/core/registry";
-import { Component } from "@odoo/owl";
+import { useService } from "@web/core/utils/hooks";
+import { Component, onWillStart, useState } from "@odoo/owl";
 
 export class MedicalClinicDashboard extends Component {
     static template = "medical_clinic.Dashboard";
     
     setup() {
         this.title = "Medical Clinic Dashboard";
+        this.orm = useService("orm");
+        this.state = useState({ kpis: null });
+        // All KPIs are aggregated server-side and fetched in a single call
+        onWillStart(async () => {
+            this.state.kpis = await this.orm.call("clinic.dashboard", "get_kpis", []);
+        });
+    }
+    
+    formatPercent(value) {
+        return `${Math.round((value || 0) * 100)}%`;
+    }
+    
+    formatAmount(value) {
+        return (value || 0).toLocaleString(undefined, { maximumFractionDigits: 2 });
     }
 }
 
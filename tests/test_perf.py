@@ -0,0 +1,91 @@
+from datetime import timedelta
+
+from odoo.tests import TransactionCase, tagged
+
+
+# Upper bounds per call of each flow of clinic.benchmark: queries are
+# deterministic and tight, wall times leave room for slower CI machines
+QUERY_BUDGETS = {
+    'booking': 60,
+    'start_consultation': 50,
+    'complete_and_invoice': 250,
+    'reminder_cron': 120,
+    'claim_totals': 25,
+    'patient_list': 6,
+    'conflict_check': 3,
+    'available_slots': 30,
+    'reporting': 15,
+    'dashboard': 20,
+}
+DURATION_BUDGETS_MS = {
+    'booking': 400,
+    'start_consultation': 400,
+    'complete_and_invoice': 2000,
+    'reminder_cron': 5000,
+    'claim_totals': 200,
+    'patient_list': 100,
+    'conflict_check': 200,
+    'available_slots': 500,
+    'reporting': 2000,
+    'dashboard': 300,
+}
+
+
+@tagged('post_install', '-at_install', 'perf')
+class TestClinicPerformance(TransactionCase):
+    
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.benchmark = cls.env['clinic.benchmark']
+        cls.counts = cls.benchmark._seed(patients=500, doctors=10, appointments_per_patient=4,
+                                         treatments_per_patient=2, batch_size=250)
+    
+    def test_seed(self):
+        self.assertEqual(self.counts['clinic.patient'], 500)
+        self.assertEqual(self.counts['clinic.appointment'], 2000)
+        self.assertTrue(self.counts['clinic.treatment'])
+        self.assertTrue(self.counts['clinic.insurance.claim'])
+        self.assertFalse(self.env['clinic.appointment'].search([])._get_conflicting_appointments(),
+                         "Seeded appointments must not overlap")
+    
+    def test_flow_budgets(self):
+        results = self.benchmark.run_flow_benchmark(samples=10)
+        for flow, budget in QUERY_BUDGETS.items():
+            with self.subTest(flow=flow):
+                self.assertIn(flow, results)
+                self.assertLessEqual(results[flow]['queries'], budget,
+                                     "%s runs more queries per call than its baseline" % flow)
+                self.assertLessEqual(results[flow]['duration_ms'], DURATION_BUDGETS_MS[flow],
+                                     "%s is slower per call than its baseline" % flow)
+    
+    def test_booking_query_count(self):
+        # Booking cost must not grow with the size of the agenda
+        Appointment = self.env['clinic.appointment']
+        patient = self.env['clinic.patient'].search([], limit=1)
+        doctor = self.env['hr.employee'].search([('is_medical_professional', '=', True)], limit=1)
+        first_slot = Appointment.search([], order='date desc', limit=1).date.replace(hour=9, minute=0)
+        
+        def book(days):
+            self.env.invalidate_all()
+            queries = self.cr.sql_log_count
+            Appointment.create({
+                'patient_id': patient.id,
+                'doctor_id': doctor.id,
+                'date': first_slot + timedelta(days=days),
+                'duration': 0.5,
+            })
+            self.env.flush_all()
+            return self.cr.sql_log_count - queries
+        
+        book(1)
+        baseline = book(2)
+        self.benchmark._seed(patients=200, doctors=2, appointments_per_patient=5, seed=7)
+        self.assertLessEqual(book(3), baseline + 2)
+    
+    def test_explain_hot_queries(self):
+        report = self.benchmark.run_explain_benchmark(repeat=1, baseline={})
+        self.assertIn('appointment_conflict', report['results'])
+        for label, result in report['results'].items():
+            with self.subTest(query=label):
+                self.assertLess(result['execution_ms'], 500)
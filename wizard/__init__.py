@@ -1 +1,2 @@
 from . import appointment_wizard
+from . import patient_import_wizard
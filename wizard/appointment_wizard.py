@@ -41,6 +41,57 @@ class AppointmentRescheduleWizard(models.TransientModel):
         return {'type': 'ir.actions.act_window_close'}
 
 
+class AppointmentSeriesEditWizard(models.TransientModel):
+    _name = 'clinic.appointment.series.edit.wizard'
+    _description = 'Edit Recurring Appointments Wizard'
+    
+    appointment_id = fields.Many2one('clinic.appointment', string='Appointment', readonly=True)
+    series_id = fields.Many2one(related='appointment_id.series_id', readonly=True)
+    old_date = fields.Datetime(related='appointment_id.date', string='Current Date', readonly=True)
+    
+    scope = fields.Selection([
+        ('this', 'This Appointment'),
+        ('following', 'This and Following Appointments'),
+    ], string='Apply To', required=True, default='following')
+    new_date = fields.Datetime(string='New Date & Time', required=True)
+    doctor_id = fields.Many2one('hr.employee', string='Doctor/Dentist', required=True,
+                               domain=[('is_medical_professional', '=', True)])
+    duration = fields.Float(string='Duration (hours)', required=True)
+    
+    @api.model
+    def default_get(self, fields_list):
+        res = super().default_get(fields_list)
+        appointment = self.env['clinic.appointment'].browse(res.get('appointment_id'))
+        if appointment:
+            res.setdefault('new_date', appointment.date)
+            res.setdefault('doctor_id', appointment.doctor_id.id)
+            res.setdefault('duration', appointment.duration)
+        return res
+    
+    def action_apply(self):
+        self.ensure_one()
+        appointment = self.appointment_id
+        if self.scope == 'this' or not self.series_id:
+            appointments = appointment
+        else:
+            appointments = self.series_id._get_following_appointments(appointment)
+        
+        # Doctor, duration and dates change together, so the conflict check
+        # only sees the final schedule
+        vals = {}
+        if self.doctor_id != appointment.doctor_id:
+            vals['doctor_id'] = self.doctor_id.id
+        if self.duration != appointment.duration:
+            vals['duration'] = self.duration
+        self.env['clinic.appointment.series']._shift_appointments(appointments, self.new_date - self.old_date, vals)
+        
+        if self.series_id:
+            self.series_id.message_post(
+                body=f"{len(appointments)} appointment(s) from {appointment.appointment_code} updated."
+            )
+        return {'type': 'ir.actions.act_window_close'}
+
+
 class InsuranceClaimRejectWizard(models.TransientModel):
     _name = 'clinic.insurance.claim.reject.wizard'
     _description = 'Reject Insurance Claim Wizard'
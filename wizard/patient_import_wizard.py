@@ -0,0 +1,175 @@
+import base64
+import csv
+import io
+import logging
+import threading
+import time
+from datetime import datetime
+
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+from odoo.tools import split_every
+
+from ..models.perf_log import track_performance
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+_logger = logging.getLogger(__name__)
+
+# Spreadsheet columns accepted by the importer, named after clinic.patient fields
+IMPORT_FIELDS = (
+    'first_name', 'last_name', 'date_of_birth', 'gender', 'blood_group',
+    'phone', 'mobile', 'email', 'street', 'street2', 'city', 'zip',
+    'emergency_contact', 'emergency_phone', 'emergency_relation',
+    'allergies', 'chronic_conditions', 'current_medications', 'notes',
+)
+
+
+class PatientImportWizard(models.TransientModel):
+    _name = 'clinic.patient.import.wizard'
+    _description = 'Bulk Patient Import Wizard'
+    
+    data_file = fields.Binary(string='File', required=True)
+    filename = fields.Char(string='File Name')
+    chunk_size = fields.Integer(string='Rows per Chunk', default=1000,
+                                help='Rows created and committed together')
+    
+    # Run statistics
+    state = fields.Selection([('draft', 'Draft'), ('done', 'Done')], default='draft')
+    imported_count = fields.Integer(string='Imported Patients', readonly=True)
+    skipped_count = fields.Integer(string='Already Existing', readonly=True,
+                                   help='Rows matching a patient with the same email, or the same name '
+                                        'when there is no email, and the same date of birth')
+    duration = fields.Float(string='Duration (s)', readonly=True)
+    rows_per_second = fields.Float(string='Rows/s', readonly=True)
+    
+    @track_performance
+    def action_import(self):
+        self.ensure_one()
+        if self.chunk_size <= 0:
+            raise UserError(_('The number of rows per chunk must be positive.'))
+        auto_commit = not getattr(threading.current_thread(), 'testing', False)
+        Patient = self.env['clinic.patient'].with_context(tracking_disable=True)
+        started = time.perf_counter()
+        imported = skipped = 0
+        seen = set()
+        required = self._get_required_fields()
+        # Data rows are numbered as in the file, after the header row
+        for rows in split_every(self.chunk_size, enumerate(self._iter_rows(), start=2)):
+            vals_list = [self._prepare_patient_vals(row, row_number, required)
+                         for row_number, row in rows]
+            # Committed chunks of an interrupted run are skipped when it is run again
+            existing = self._get_existing_keys(vals_list)
+            new_vals_list = []
+            for vals in vals_list:
+                key = self._get_import_key(vals)
+                if key in existing or key in seen:
+                    skipped += 1
+                    continue
+                seen.add(key)
+                new_vals_list.append(vals)
+            Patient.create(new_vals_list)
+            imported += len(new_vals_list)
+            if auto_commit:
+                self.env.cr.commit()
+        elapsed = time.perf_counter() - started
+        rate = imported / elapsed if elapsed else 0.0
+        _logger.info("Patient import: %d rows, %d already existing, in %.2fs (%.1f rows/s)",
+                     imported, skipped, elapsed, rate)
+        self.write({
+            'state': 'done',
+            'imported_count': imported,
+            'skipped_count': skipped,
+            'duration': elapsed,
+            'rows_per_second': rate,
+        })
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
+    
+    def _iter_rows(self):
+        """Yield one dict per data row, reading the file lazily"""
+        content = base64.b64decode(self.data_file)
+        if (self.filename or '').lower().endswith('.xlsx'):
+            if openpyxl is None:
+                raise UserError(_('The openpyxl Python library is required to import XLSX files.'))
+            workbook = openpyxl.load_workbook(io.BytesIO(content), read_only=True, data_only=True)
+            rows = workbook.active.iter_rows(values_only=True)
+            header = [str(cell or '').strip() for cell in next(rows, ())]
+            for row in rows:
+                yield dict(zip(header, row))
+            workbook.close()
+        else:
+            reader = csv.DictReader(io.TextIOWrapper(io.BytesIO(content), encoding='utf-8-sig', newline=''))
+            yield from reader
+    
+    @api.model
+    def _get_required_fields(self):
+        """Return the imported fields a patient cannot be created without"""
+        fields_by_name = self.env['clinic.patient']._fields
+        return [field_name for field_name in IMPORT_FIELDS
+                if fields_by_name[field_name].required and fields_by_name[field_name].default is None]
+    
+    @api.model
+    def _prepare_patient_vals(self, row, row_number, required):
+        vals = {}
+        for field_name in IMPORT_FIELDS:
+            value = row.get(field_name)
+            if isinstance(value, str):
+                value = value.strip()
+            if value in (None, ''):
+                continue
+            if field_name == 'date_of_birth':
+                try:
+                    value = value.date() if isinstance(value, datetime) else fields.Date.to_date(value)
+                except (TypeError, ValueError):
+                    raise UserError(_('Row %(row)s: invalid date of birth "%(value)s".', row=row_number, value=value))
+            elif not isinstance(value, str):
+                value = str(value)
+            field = self.env['clinic.patient']._fields[field_name]
+            if field.type == 'selection' and value not in field.get_values(self.env):
+                raise UserError(_('Row %(row)s: invalid %(field)s "%(value)s".',
+                                  row=row_number, field=field_name, value=value))
+            vals[field_name] = value
+        missing = [field_name for field_name in required if field_name not in vals]
+        if missing:
+            raise UserError(_('Row %(row)s: missing %(fields)s.', row=row_number, fields=', '.join(missing)))
+        return vals
+    
+    @api.model
+    def _get_import_key(self, vals):
+        """Natural key of a patient: email and date of birth, or name and date of birth without email"""
+        if vals.get('email'):
+            return ('email', vals['email'].lower(), vals['date_of_birth'])
+        return ('name', vals['first_name'].lower(), vals['last_name'].lower(), vals['date_of_birth'])
+    
+    @api.model
+    def _get_existing_keys(self, vals_list):
+        """Return the natural keys of ``vals_list`` already used by patients, archived ones included"""
+        if not vals_list:
+            return set()
+        Patient = self.env['clinic.patient']
+        Patient.flush_model(['email', 'first_name', 'last_name', 'date_of_birth'])
+        self.env.cr.execute("""
+            SELECT lower(email), lower(first_name), lower(last_name), date_of_birth
+              FROM clinic_patient
+             WHERE date_of_birth = ANY(%s)
+               AND (lower(email) = ANY(%s) OR lower(last_name) = ANY(%s))
+        """, [
+            list({vals['date_of_birth'] for vals in vals_list}),
+            list({vals['email'].lower() for vals in vals_list if vals.get('email')}),
+            list({vals['last_name'].lower() for vals in vals_list}),
+        ])
+        keys = set()
+        for email, first_name, last_name, date_of_birth in self.env.cr.fetchall():
+            if email:
+                keys.add(('email', email, date_of_birth))
+            keys.add(('name', first_name, last_name, date_of_birth))
+        return keys